@@ -0,0 +1,4 @@
+"""Modules shared by the Python services: discovery, balancing, metrics and messaging helpers.
+
+Each service image copies this package to /shared and puts /shared on PYTHONPATH.
+"""
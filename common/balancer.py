@@ -0,0 +1,310 @@
+import os
+import time
+import math
+import random
+import asyncio
+from collections import deque
+from typing import Optional
+import httpx
+from fastapi import HTTPException
+from . import metrics
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+# latency estimate: peak EWMA with this time constant (seconds); LB_DEFAULT_RTT until anything is measured
+LB_DECAY = float(os.getenv("LB_DECAY", 10.0))
+LB_DEFAULT_RTT = float(os.getenv("LB_DEFAULT_RTT", 0.05))
+# circuit breaker: consecutive failures (5xx or transport errors) that open it, and for how long
+LB_FAILURE_THRESHOLD = int(os.getenv("LB_FAILURE_THRESHOLD", 5))
+LB_OPEN_SECONDS = float(os.getenv("LB_OPEN_SECONDS", 10.0))
+# latency a failure counts as, so an instance failing fast does not look like the fastest
+LB_FAILURE_PENALTY = float(os.getenv("LB_FAILURE_PENALTY", 1.0))
+# outlier ejection: an instance this many times slower than the median is skipped for a while
+LB_OUTLIER_FACTOR = float(os.getenv("LB_OUTLIER_FACTOR", 3.0))
+LB_OUTLIER_MIN_SAMPLES = int(os.getenv("LB_OUTLIER_MIN_SAMPLES", 20))
+LB_EJECT_SECONDS = float(os.getenv("LB_EJECT_SECONDS", 30.0))
+LB_MAX_EJECTED = float(os.getenv("LB_MAX_EJECTED", 0.5))
+# hedged GETs: a second instance is tried once the first is slower than the recent p95
+LB_HEDGE = _env_bool("LB_HEDGE", True)
+LB_HEDGE_QUANTILE = float(os.getenv("LB_HEDGE_QUANTILE", 0.95))
+LB_HEDGE_MIN_DELAY = float(os.getenv("LB_HEDGE_MIN_DELAY", 0.005))
+# at most this share of requests may be hedged, so a slow platform is not loaded twice
+LB_HEDGE_BUDGET = float(os.getenv("LB_HEDGE_BUDGET", 0.1))
+LB_LATENCY_WINDOW = int(os.getenv("LB_LATENCY_WINDOW", 500))
+
+
+class Instance:
+    """Load, latency and health of one upstream endpoint"""
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.inflight = 0
+        self.ewma = None
+        self.stamp = time.monotonic()
+        self.samples = 0
+        self.failures = 0
+        self.open_until = 0.0    # circuit breaker: 0 = closed
+        self.probing = False     # half-open: one trial request in flight
+        self.ejected_until = 0.0
+
+    def rtt(self, now: float, seed: float = LB_DEFAULT_RTT) -> float:
+        # an estimate nobody refreshes decays, so a once-slow instance is tried again
+        if self.ewma is None:
+            return seed
+        return self.ewma * math.exp(-max(0.0, now - self.stamp) / LB_DECAY)
+
+    def cost(self, now: float, seed: float) -> float:
+        # expected wait: latency estimate times the queue it would join
+        return self.rtt(now, seed) * (self.inflight + 1)
+
+    def available(self, now: float) -> bool:
+        if now < self.ejected_until:
+            return False
+        if not self.open_until:
+            return True
+        return now >= self.open_until and not self.probing
+
+    def observe(self, rtt: float, now: float):
+        # peak EWMA: jumps up to a slow sample at once, decays back over LB_DECAY
+        if self.ewma is None or rtt > self.ewma:
+            self.ewma = rtt
+        else:
+            w = math.exp(-(now - self.stamp) / LB_DECAY)
+            self.ewma = self.ewma * w + rtt * (1 - w)
+        self.stamp = now
+        self.samples += 1
+
+
+class Balancer:
+    """Client-side load balancing over one service's discovered instances.
+
+    Each request goes to the cheaper of two randomly sampled instances
+    (power of two choices), where cost is the peak-EWMA latency times the
+    requests already outstanding there. An instance whose breaker is open
+    (LB_FAILURE_THRESHOLD consecutive failures) is skipped for
+    LB_OPEN_SECONDS, then gets one trial request. An instance LB_OUTLIER_FACTOR
+    times slower than the median is ejected for LB_EJECT_SECONDS, never more
+    than LB_MAX_EJECTED of the instances. If nothing is available, all
+    instances are used rather than failing every request.
+
+    Idempotent GETs are hedged: if the first attempt is still running after
+    the service's recent p95 latency, a second instance is tried and the
+    first good response wins; the other attempt is cancelled.
+
+    The state is not locked, so a balancer is only used from its event loop;
+    worker threads hand their calls to the loop (run_coroutine_threadsafe).
+    """
+    def __init__(self, name: str, endpoints, url_template: str, hedge: bool = LB_HEDGE, rng=random):
+        self.name = name
+        self.endpoints = endpoints        # callable returning [(host, port), ...]
+        self.url_template = url_template  # e.g. "http://reviews_backend_{port}:{port}"
+        self.hedge = hedge
+        self.rng = rng
+        self.instances = {}
+        self.latencies = deque(maxlen=LB_LATENCY_WINDOW)
+        self._hedge_delay = None
+        self._since_quantile = 0
+        self.requests = 0
+        self.hedged = 0
+
+    def url(self, endpoint) -> str:
+        host, port = endpoint
+        return self.url_template.format(host=host, port=port)
+
+    def _instances(self):
+        endpoints = self.endpoints()
+        if not endpoints:
+            raise HTTPException(status_code=503, detail=f"{self.name} not available")
+        if len(self.instances) != len(endpoints) or any(e not in self.instances for e in endpoints):
+            self.instances = {e: self.instances.get(e) or Instance(e) for e in endpoints}
+        return list(self.instances.values())
+
+    def pick(self, exclude=(), probe: bool = True):
+        """Endpoint for the next request, or None if every instance is excluded; 503 if none is known.
+
+        With `probe`, a half-open instance that is picked is held for this one
+        trial request, so the caller must report its outcome with record().
+        """
+        now = time.monotonic()
+        candidates = [i for i in self._instances() if i.endpoint not in exclude]
+        if not candidates:
+            return None
+        ready = [i for i in candidates if i.available(now)] or candidates
+        if len(ready) == 1:
+            choice = ready[0]
+        else:
+            a, b = self.rng.sample(ready, 2)
+            # unmeasured instances are assumed typical, so new ones get traffic without a burst
+            seed = self._median(now) if a.ewma is None or b.ewma is None else LB_DEFAULT_RTT
+            choice = a if a.cost(now, seed) <= b.cost(now, seed) else b
+        if probe and choice.open_until and now >= choice.open_until:
+            choice.probing = True
+        return choice.endpoint
+
+    def _median(self, now: float, min_samples: int = 1) -> float:
+        rtts = sorted(i.rtt(now) for i in self.instances.values() if i.samples >= min_samples)
+        return rtts[len(rtts) // 2] if rtts else LB_DEFAULT_RTT
+
+    def base_url(self) -> str:
+        """URL of an instance for a caller that sends the request itself.
+
+        No outcome is recorded for it, so it never claims a half-open instance's
+        trial request; prefer request() where the call can go through it.
+        """
+        return self.url(self.pick(probe=False))
+
+    def record(self, endpoint, rtt: Optional[float], ok: bool, cancelled: bool = False):
+        """Outcome of one attempt.
+
+        A cancelled attempt (e.g. hedged away) ran for at least `rtt`, so that
+        can raise the instance's latency estimate but never lower it; rtt None
+        means no time is known.
+        """
+        instance = self.instances.get(endpoint)
+        if instance is None:
+            return
+        now = time.monotonic()
+        instance.inflight = max(0, instance.inflight - 1)
+        if cancelled or rtt is None:
+            instance.probing = False
+            # without this, a replica whose requests keep being hedged away never looks slow
+            if rtt is not None and rtt > instance.rtt(now, self._median(now)):
+                instance.ewma, instance.stamp = rtt, now
+            return
+        instance.observe(rtt if ok else max(rtt, LB_FAILURE_PENALTY), now)
+        if ok:
+            instance.failures = 0
+            instance.open_until = 0.0
+            instance.probing = False
+            self.latencies.append(rtt)
+            self._since_quantile += 1
+            self._check_outlier(instance, now)
+        else:
+            instance.failures += 1
+            if instance.probing or instance.failures >= LB_FAILURE_THRESHOLD:
+                if not instance.open_until or instance.probing:
+                    print(f"LOG: Circuit open for {self.name} {endpoint} after {instance.failures} failures")
+                instance.open_until = now + LB_OPEN_SECONDS
+            instance.probing = False
+
+    def _check_outlier(self, instance: Instance, now: float):
+        peers = sum(1 for i in self.instances.values() if i.samples >= LB_OUTLIER_MIN_SAMPLES)
+        if instance.samples < LB_OUTLIER_MIN_SAMPLES or peers < 2:
+            return
+        median = self._median(now, LB_OUTLIER_MIN_SAMPLES)
+        if instance.rtt(now) <= LB_OUTLIER_FACTOR * median:
+            return
+        ejected = sum(1 for i in self.instances.values() if now < i.ejected_until)
+        if ejected + 1 > LB_MAX_EJECTED * len(self.instances):
+            return
+        print(f"LOG: Ejecting {self.name} {instance.endpoint}: {instance.rtt(now) * 1000:.0f} ms vs median {median * 1000:.0f} ms")
+        instance.ejected_until = now + LB_EJECT_SECONDS
+        # it comes back with a clean slate, as an unmeasured instance
+        instance.ewma = None
+        instance.samples = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Recent LB_HEDGE_QUANTILE latency, recomputed every 50 samples; None until known"""
+        if len(self.latencies) < LB_OUTLIER_MIN_SAMPLES:
+            return None
+        if self._hedge_delay is None or self._since_quantile >= 50:
+            ordered = sorted(self.latencies)
+            self._hedge_delay = max(LB_HEDGE_MIN_DELAY, ordered[int(LB_HEDGE_QUANTILE * (len(ordered) - 1))])
+            self._since_quantile = 0
+        return self._hedge_delay
+
+    async def _attempt(self, client: httpx.AsyncClient, endpoint, method: str, path: str, stream: bool, kwargs):
+        instance = self.instances.get(endpoint)
+        if instance is not None:
+            instance.inflight += 1
+        started = time.monotonic()
+        try:
+            if stream:
+                request = client.build_request(method, self.url(endpoint) + path, **kwargs)
+                response = await client.send(request, stream=True)
+            else:
+                response = await client.request(method, self.url(endpoint) + path, **kwargs)
+        except asyncio.CancelledError:
+            self.record(endpoint, time.monotonic() - started, False, cancelled=True)
+            self._observe(endpoint, method, "cancelled", started)
+            raise
+        except httpx.TransportError:
+            self.record(endpoint, time.monotonic() - started, False)
+            self._observe(endpoint, method, "error", started)
+            raise
+        self.record(endpoint, time.monotonic() - started, response.status_code < 500)
+        self._observe(endpoint, method, response.status_code, started)
+        return response
+
+    def _observe(self, endpoint, method: str, status, started: float):
+        host, port = endpoint
+        metrics.observe_upstream(self.name, f"{host}:{port}", method, status, time.monotonic() - started)
+
+    async def request(self, client: httpx.AsyncClient, method: str, path: str,
+                      hedge: Optional[bool] = None, stream: bool = False, **kwargs) -> httpx.Response:
+        """Send `method path` to a chosen instance; like client.request, 5xx responses are returned"""
+        if hedge is None:
+            hedge = self.hedge and method == "GET" and not stream
+        self.requests += 1
+        first = self.pick()
+        delay = self.hedge_delay() if hedge else None
+        if delay is None:
+            return await self._attempt(client, first, method, path, stream, kwargs)
+        attempts = [asyncio.ensure_future(self._attempt(client, first, method, path, stream, kwargs))]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done and self.hedged < LB_HEDGE_BUDGET * self.requests:
+                second = self.pick(exclude={first})
+                if second is not None:
+                    self.hedged += 1
+                    attempts.append(asyncio.ensure_future(self._attempt(client, second, method, path, stream, kwargs)))
+            return await self._first_good(attempts)
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+
+    async def _first_good(self, attempts):
+        # first non-5xx response wins; otherwise the last response, or the last error
+        pending, result, error = set(attempts), None, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is not None:
+                    error = attempt.exception()
+                elif attempt.result().status_code < 500:
+                    return attempt.result()
+                else:
+                    result = attempt.result()
+        if result is not None:
+            return result
+        raise error
+
+    async def get(self, client: httpx.AsyncClient, path: str, **kwargs) -> httpx.Response:
+        return await self.request(client, "GET", path, **kwargs)
+
+    async def post(self, client: httpx.AsyncClient, path: str, **kwargs) -> httpx.Response:
+        return await self.request(client, "POST", path, **kwargs)
+
+    async def put(self, client: httpx.AsyncClient, path: str, **kwargs) -> httpx.Response:
+        return await self.request(client, "PUT", path, **kwargs)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_delay_ms": round(self._hedge_delay * 1000, 2) if self._hedge_delay else None,
+            "instances": [
+                {
+                    "endpoint": f"{host}:{port}",
+                    "inflight": i.inflight,
+                    "ewma_ms": round(i.ewma * 1000, 2) if i.ewma is not None else None,
+                    "failures": i.failures,
+                    "open": bool(i.open_until) and now < i.open_until,
+                    "ejected": now < i.ejected_until,
+                }
+                for (host, port), i in self.instances.items()
+            ],
+        }
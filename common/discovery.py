@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import threading
+import consul
+from fastapi import HTTPException
+
+CONSUL_HOST = os.getenv("CONSUL_HOST", "consul")
+CONSUL_PORT = int(os.getenv("CONSUL_PORT", 8500))
+# how long a Consul blocking query may hang before returning unchanged data
+CONSUL_WATCH_WAIT = os.getenv("CONSUL_WATCH_WAIT", "30s")
+CONSUL_RETRY_DELAY = float(os.getenv("CONSUL_RETRY_DELAY", 2.0))
+
+
+class ServiceWatcher:
+    """Keeps the healthy endpoints of one Consul service in memory.
+
+    A daemon thread long-polls Consul with blocking queries (index/wait) and
+    swaps in the new endpoint list whenever it changes. If Consul is
+    unreachable or reports no instances, the last known-good list is kept.
+    """
+    def __init__(self, name: str, wait: str = CONSUL_WATCH_WAIT, retry_delay: float = CONSUL_RETRY_DELAY):
+        self.name = name
+        self.wait = wait
+        self.retry_delay = retry_delay
+        self.endpoints = []  # list of (address, port), replaced atomically
+        self.updated_at = None
+        self._index = None
+        self._consul = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _fetch(self, blocking: bool = True):
+        index, nodes = self._consul.health.service(
+            self.name,
+            index=self._index if blocking else None,
+            wait=self.wait if blocking else None,
+            passing=True,
+        )
+        endpoints = [(n['Service']['Address'], n['Service']['Port']) for n in nodes]
+        if not endpoints:
+            # same fallback the per-request lookup used: the local agent's catalogue
+            svcs = self._consul.agent.services()
+            endpoints = [(svc['Address'], svc['Port']) for svc in svcs.values() if svc['Service'] == self.name]
+        return index, endpoints
+
+    def refresh(self, blocking: bool = True):
+        index, endpoints = self._fetch(blocking)
+        # Consul may reset its index (e.g. after a restart); start over in that case
+        if index is not None and self._index is not None and int(index) < int(self._index):
+            index = None
+        self._index = index
+        if endpoints:
+            self.endpoints = endpoints
+            self.updated_at = time.time()
+        elif self.endpoints:
+            print(f"LOG: Consul reports no instances of {self.name}, keeping last known endpoints")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.refresh(blocking=True)
+            except Exception as e:
+                print(f"LOG: Consul watch for {self.name} failed: {e}")
+                self._index = None
+                self._stopped.wait(self.retry_delay)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"consul-watch-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+
+class ServiceDiscovery:
+    """In-memory service lookup backed by one ServiceWatcher per service"""
+    def __init__(self, service_names=()):
+        self._watchers = {}
+        self._started = False
+        for name in service_names:
+            self.watch(name)
+
+    def watch(self, name: str) -> ServiceWatcher:
+        watcher = self._watchers.get(name)
+        if watcher is None:
+            watcher = self._watchers[name] = ServiceWatcher(name)
+            if self._started:
+                watcher.start()
+        return watcher
+
+    async def start(self):
+        # prime every cache with a non-blocking query so the first requests find endpoints
+        async def prime(watcher):
+            try:
+                await asyncio.to_thread(watcher.refresh, False)
+            except Exception as e:
+                print(f"LOG: initial Consul lookup for {watcher.name} failed: {e}")
+        await asyncio.gather(*(prime(w) for w in self._watchers.values()))
+        for watcher in self._watchers.values():
+            watcher.start()
+        self._started = True
+
+    def stop(self):
+        for watcher in self._watchers.values():
+            watcher.stop()
+
+    def endpoints(self, name: str):
+        """Return the cached (address, port) list for a service, possibly empty"""
+        return self.watch(name).endpoints
+
+    def ports(self, name: str):
+        return [p for _, p in self.endpoints(name)]
+
+    def require(self, name: str):
+        """Like endpoints(), but raise 503 when no instance is known"""
+        endpoints = self.endpoints(name)
+        if not endpoints:
+            raise HTTPException(status_code=503, detail=f"{name} not available")
+        return endpoints
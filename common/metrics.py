@@ -0,0 +1,310 @@
+import time
+import bisect
+import asyncio
+import threading
+from starlette.responses import Response
+from starlette.routing import Match
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# seconds; request and upstream latencies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# seconds; single database / cache commands
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+REGISTRY = []
+
+
+class _Shards:
+    """One value map per thread: a thread only ever writes its own, so updates need no lock.
+
+    Readers copy every shard (dict.copy is atomic under the GIL) and merge them.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._all = []
+
+    def mine(self) -> dict:
+        shard = getattr(self._local, "values", None)
+        if shard is None:
+            shard = self._local.values = {}
+            self._all.append(shard)
+        return shard
+
+    def snapshots(self):
+        return [shard.copy() for shard in list(self._all)]
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._shards = _Shards()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shards.mine()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> dict:
+        merged = {}
+        for shard in self._shards.snapshots():
+            for labels, value in shard.items():
+                merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield self.name, dict(zip(self.labels, labels)), value
+
+
+class Gauge(Counter):
+    """Up/down counter (e.g. requests in flight); the value is the sum over threads"""
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels):
+        shard = self._shards.mine()
+        counts = shard.get(labels)
+        if counts is None:
+            # per-bucket counts (last one is +Inf), then the sum
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def time(self, *labels) -> "Timer":
+        return Timer(self, labels)
+
+    def samples(self):
+        merged = {}
+        for shard in self._shards.snapshots():
+            for labels, counts in shard.items():
+                total = merged.setdefault(labels, [0] * len(counts))
+                for i, n in enumerate(list(counts)):
+                    total[i] += n
+        for labels, counts in sorted(merged.items()):
+            names = dict(zip(self.labels, labels))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield f"{self.name}_bucket", {**names, "le": _format(bound)}, cumulative
+            yield f"{self.name}_sum", names, counts[-1]
+            yield f"{self.name}_count", names, cumulative
+
+
+class Timer:
+    """Observes the time spent in a `with` / `async with` block; the histogram's
+    last label (outcome) is filled in as "ok" or "error"."""
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels, "error" if exc_type else "ok")
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.__exit__(exc_type, exc, tb)
+
+
+def _format(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            if labels:
+                rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{rendered}}} {_format(value)}")
+            else:
+                lines.append(f"{name} {_format(value)}")
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled", ("route", "method", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Time to the end of the response body",
+                         ("route", "method", "status"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled", ("route", "method"))
+UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds",
+                             "Calls to other services, to the response headers; status is error when none came",
+                             ("target", "instance", "method", "status"))
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "Mongo, Redis and Postgres commands",
+                          ("system", "operation", "outcome"), buckets=QUERY_BUCKETS)
+BROKER_MESSAGES = Counter("broker_messages_total", "RabbitMQ messages published and consumed",
+                          ("exchange", "direction", "outcome"))
+
+
+def observe_upstream(target: str, instance: str, method: str, status, seconds: float):
+    UPSTREAM_LATENCY.observe(seconds, target, instance, method, str(status))
+
+def count_messages(exchange: str, direction: str, outcome: str = "ok", amount: int = 1):
+    BROKER_MESSAGES.inc(exchange, direction, outcome, amount=amount)
+
+
+class MetricsMiddleware:
+    """Counts, times and tracks in-flight HTTP requests by route template and status.
+
+    Plain ASGI, so streamed responses are neither buffered nor cut short;
+    their time runs until the last body chunk is sent.
+    """
+    def __init__(self, app, routes=()):
+        self.app = app
+        self.routes = routes
+
+    def route_of(self, scope) -> str:
+        partial = None
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        # unknown paths share one label, so scanners cannot blow up the series count
+        return partial or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route, method = self.route_of(scope), scope["method"]
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(route, method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec(route, method)
+            code = str(status[0])
+            HTTP_REQUESTS.inc(route, method, code)
+            HTTP_LATENCY.observe(time.perf_counter() - start, route, method, code)
+
+
+async def metrics_endpoint():
+    return Response(render(), media_type=CONTENT_TYPE)
+
+def instrument(app):
+    """Mount request metrics and GET /metrics on a FastAPI app"""
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+    app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+
+
+def instrument_redis(client):
+    """Time every command and pipeline of a redis-py client (sync or asyncio); returns the client"""
+    execute_command, pipeline = client.execute_command, client.pipeline
+
+    def op(args) -> str:
+        return str(args[0]).lower() if args else "unknown"
+
+    if asyncio.iscoroutinefunction(execute_command):
+        async def timed_command(*args, **options):
+            with QUERY_LATENCY.time("redis", op(args)):
+                return await execute_command(*args, **options)
+
+        def timed_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            async def timed_execute(*a, **kw):
+                with QUERY_LATENCY.time("redis", "pipeline"):
+                    return await execute(*a, **kw)
+            pipe.execute = timed_execute
+            return pipe
+    else:
+        def timed_command(*args, **options):
+            with QUERY_LATENCY.time("redis", op(args)):
+                return execute_command(*args, **options)
+
+        def timed_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def timed_execute(*a, **kw):
+                with QUERY_LATENCY.time("redis", "pipeline"):
+                    return execute(*a, **kw)
+            pipe.execute = timed_execute
+            return pipe
+    client.execute_command = timed_command
+    client.pipeline = timed_pipeline
+    return client
+
+def mongo_listener():
+    """pymongo command listener timing every Mongo command (pass in `event_listeners`)"""
+    from pymongo import monitoring
+
+    class CommandTimer(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            QUERY_LATENCY.observe(event.duration_micros / 1e6, "mongo", event.command_name, "ok")
+
+        def failed(self, event):
+            QUERY_LATENCY.observe(event.duration_micros / 1e6, "mongo", event.command_name, "error")
+
+    return CommandTimer()
+
+def instrument_sqlalchemy(engine):
+    """Time every statement a SQLAlchemy engine sends, by its leading keyword (select, insert, ...)"""
+    from sqlalchemy import event
+
+    def observe(conn, statement, outcome):
+        starts = conn.info.get("metrics_query_start")
+        if starts:
+            words = (statement or "").split(None, 1)
+            operation = words[0].lower() if words else "unknown"
+            QUERY_LATENCY.observe(time.perf_counter() - starts.pop(), "postgres", operation, outcome)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        observe(conn, statement, "ok")
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None:
+            observe(context.connection, context.statement, "error")
+
+    return engine
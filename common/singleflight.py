@@ -0,0 +1,43 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one outstanding call.
+
+    The first caller for a key starts the call as a task; callers arriving
+    while it runs wait for the same result, or get the same exception. A
+    cancelled waiter only stops waiting; the call itself is cancelled once
+    nobody waits for it any more. Nothing is cached: the key is forgotten
+    as soon as the call finishes, so later callers start a fresh one.
+    """
+    def __init__(self):
+        self._calls = {}   # key -> [task, number of waiters]
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key, fn, *args, **kwargs):
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        call[1] += 1
+        try:
+            # shielded, so one waiter's cancellation does not cancel the shared call
+            return await asyncio.shield(call[0])
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not call[0].done():
+                # the last waiter gave up; new callers must not join a call being cancelled
+                self._forget(key, call)
+                call[0].cancel()
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
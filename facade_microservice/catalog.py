@@ -0,0 +1,219 @@
+import os
+import csv
+import json
+import time
+import bisect
+import difflib
+import hashlib
+import threading
+from typing import Optional
+
+BEER_CSV = os.getenv("BEER_CATALOG", os.path.join(os.path.dirname(__file__), "beer.csv"))
+# how often (seconds) requests check the CSV's mtime for a hot reload
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", 2.0))
+# pre-serialized query results kept per catalog version
+CATALOG_QUERY_CACHE = int(os.getenv("CATALOG_QUERY_CACHE", 1024))
+FUZZY_CUTOFF = 0.6
+
+
+def fold(text: Optional[str]) -> str:
+    return (text or "").strip().casefold()
+
+def beer_id(name: str) -> str:
+    """Stable id derived from the name, so it survives reordering and edits of other rows"""
+    return hashlib.sha1(fold(name).encode()).hexdigest()[:12]
+
+def parse_abv(value: Optional[str]) -> Optional[float]:
+    try:
+        return float((value or "").strip().replace(",", "."))
+    except ValueError:
+        return None
+
+def to_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class Beer:
+    __slots__ = ("id", "name", "origin", "abv", "type", "type1", "sort")
+
+    def __init__(self, row: dict):
+        self.name = (row.get("Name") or "").strip()
+        self.id = beer_id(self.name)
+        self.origin = (row.get("Origin") or "").strip()
+        self.abv = parse_abv(row.get("ABV"))
+        self.type = (row.get("Type") or "").strip()
+        self.type1 = (row.get("Type1") or "").strip()
+        self.sort = (row.get("Sort") or "").strip()
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class Catalog:
+    """One immutable version of the beer catalog with its indexes.
+
+    Beers are typed (numeric ABV, stable id) and indexed by origin, type and
+    sort (case-insensitive), by ABV (sorted for range lookups) and by name
+    and name words (sorted for prefix lookups). Response bodies are
+    serialized once per version; `version` doubles as the ETag.
+    """
+    def __init__(self, rows, version: str):
+        self.version = version
+        self.etag = f'"{version}"'
+        self.raw = list(rows)
+        beers, seen = [], set()
+        for row in self.raw:
+            beer = Beer(row)
+            if beer.name and beer.id not in seen:
+                seen.add(beer.id)
+                beers.append(beer)
+        self.beers = sorted(beers, key=lambda b: fold(b.name))
+        self.by_id = {b.id: b for b in self.beers}
+        self.by_origin, self.by_type, self.by_sort = {}, {}, {}
+        for i, b in enumerate(self.beers):
+            self.by_origin.setdefault(fold(b.origin), []).append(i)
+            self.by_type.setdefault(fold(b.type), []).append(i)
+            self.by_sort.setdefault(fold(b.sort), []).append(i)
+        self.by_abv = sorted((b.abv, i) for i, b in enumerate(self.beers) if b.abv is not None)
+        self._abv_keys = [abv for abv, _ in self.by_abv]
+        # (folded name or name word, beer position), for prefix matches on any word
+        self.name_keys = sorted(
+            {(word, i) for i, b in enumerate(self.beers) for word in [fold(b.name)] + fold(b.name).split()})
+        self._folded_names = [fold(b.name) for b in self.beers]
+        # legacy payloads, exactly as before: raw CSV rows and the list of names
+        self.all_json = to_json(self.raw)
+        self.names_json = to_json([row.get("Name") for row in self.raw])
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, key, value):
+        with self._lock:
+            if len(self._cache) >= CATALOG_QUERY_CACHE:
+                self._cache.clear()
+            self._cache[key] = value
+        return value
+
+    def cached(self, key, build) -> bytes:
+        """Serialized body for `key`, built once per catalog version"""
+        body = self._cache.get(key)
+        return body if body is not None else self._remember(key, to_json(build()))
+
+    def page(self, filters: tuple, offset: int, limit: int):
+        """(serialized page of query(*filters), whether more beers follow), cached per version"""
+        key = ("page", filters, offset, limit)
+        hit = self._cache.get(key)
+        if hit is None:
+            beers = self.query(*filters)
+            hit = self._remember(key, (to_json([b.to_dict() for b in beers[offset:offset + limit]]),
+                                       offset + limit < len(beers)))
+        return hit
+
+    def abv_range(self, min_abv: Optional[float], max_abv: Optional[float]) -> set:
+        lo = 0 if min_abv is None else bisect.bisect_left(self._abv_keys, min_abv)
+        hi = len(self._abv_keys) if max_abv is None else bisect.bisect_right(self._abv_keys, max_abv)
+        return {i for _, i in self.by_abv[lo:hi]}
+
+    def prefix(self, q: str) -> list:
+        """Beer positions whose name or a word of it starts with `q`, in name order"""
+        q = fold(q)
+        start = bisect.bisect_left(self.name_keys, (q, -1))
+        found = set()
+        for key, i in self.name_keys[start:]:
+            if not key.startswith(q):
+                break
+            found.add(i)
+        return sorted(found)
+
+    def fuzzy(self, q: str, limit: int) -> list:
+        """Beer positions with names similar to `q` (typos), best match first"""
+        q = fold(q)
+        scored = []
+        for i, name in enumerate(self._folded_names):
+            matcher = difflib.SequenceMatcher(None, q, name[:len(q) + 2])
+            if matcher.real_quick_ratio() >= FUZZY_CUTOFF and matcher.quick_ratio() >= FUZZY_CUTOFF:
+                ratio = matcher.ratio()
+                if ratio >= FUZZY_CUTOFF:
+                    scored.append((-ratio, i))
+        return [i for _, i in sorted(scored)[:limit]]
+
+    def autocomplete(self, q: str, limit: int) -> list:
+        """Prefix matches first, topped up with fuzzy matches"""
+        matches = self.prefix(q)[:limit]
+        if len(matches) < limit:
+            matches += [i for i in self.fuzzy(q, limit) if i not in matches][:limit - len(matches)]
+        return [{"id": self.beers[i].id, "name": self.beers[i].name} for i in matches]
+
+    def query(self, origin: Optional[str] = None, type: Optional[str] = None, sort: Optional[str] = None,
+              min_abv: Optional[float] = None, max_abv: Optional[float] = None, q: Optional[str] = None,
+              order_by: str = "name", descending: bool = False):
+        """Beers matching every given filter, ordered by `order_by`; beers without ABV sort last"""
+        candidates = None
+        for index, value in ((self.by_origin, origin), (self.by_type, type), (self.by_sort, sort)):
+            if value is not None:
+                found = set(index.get(fold(value), ()))
+                candidates = found if candidates is None else candidates & found
+        if min_abv is not None or max_abv is not None:
+            found = self.abv_range(min_abv, max_abv)
+            candidates = found if candidates is None else candidates & found
+        if q:
+            found = set(self.prefix(q))
+            candidates = found if candidates is None else candidates & found
+        positions = range(len(self.beers)) if candidates is None else sorted(candidates)
+        beers = [self.beers[i] for i in positions]
+        if order_by == "abv":
+            with_abv = sorted((b for b in beers if b.abv is not None), key=lambda b: b.abv, reverse=descending)
+            return with_abv + [b for b in beers if b.abv is None]
+        if order_by == "origin":
+            return sorted(beers, key=lambda b: (fold(b.origin), fold(b.name)), reverse=descending)
+        return beers[::-1] if descending else beers
+
+
+def load_catalog(path: str = BEER_CSV) -> Catalog:
+    with open(path, "rb") as f:
+        data = f.read()
+    rows = list(csv.DictReader(data.decode("utf-8").splitlines()))
+    return Catalog(rows, hashlib.sha1(data).hexdigest()[:16])
+
+
+class CatalogStore:
+    """The current catalog, reloaded when the CSV's mtime changes.
+
+    Requests check the mtime at most every `check_interval` seconds; a CSV
+    that fails to load keeps the previous version in service.
+    """
+    def __init__(self, path: str = BEER_CSV, check_interval: float = CATALOG_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._catalog = Catalog([], "empty")
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            catalog = load_catalog(self.path)
+        except FileNotFoundError:
+            print(f"beer.csv not found at {self.path}")
+            return
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            print(f"LOG: Beer catalog reload failed, keeping version {self._catalog.version}: {e}")
+            return
+        if catalog.version != self._catalog.version:
+            print(f"LOG: Beer catalog version {catalog.version} loaded ({len(catalog.beers)} beers)")
+        self._catalog, self._mtime = catalog, mtime
+
+    def current(self) -> Catalog:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    try:
+                        changed = os.stat(self.path).st_mtime_ns != self._mtime
+                    except OSError:
+                        changed = False
+                    if changed:
+                        self.reload()
+        return self._catalog
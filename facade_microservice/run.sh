@@ -9,12 +9,14 @@ fi
 # Default values
 FACADE_PORT=${FACADE_PORT:-8009}
 USER_SERVICE_PORT=${USER_SERVICE_PORT:-8001}
+SECRET_KEY=${SECRET_KEY:-your_super_secret}
 NETWORK_NAME=${NETWORK_NAME:-beer_review_network}
 CONTAINER_NAME="beer_review_facade_service"
 
 # Build the image
 echo "Building facade service image"
-sudo docker build -t beer_review_facade_service ../facade_microservice
+# the repo root is the build context, so the image can copy common/
+sudo docker build -t beer_review_facade_service -f ../facade_microservice/dockerfile ..
 
 # Check if container exists
 if sudo docker ps -a --format '{{.Names}}' | grep -q "^${CONTAINER_NAME}$"; then
@@ -29,6 +31,7 @@ sudo docker run  \
   --name "$CONTAINER_NAME" \
   --network "$NETWORK_NAME" \
   -e USER_SERVICE_URL="http://beer_review_user_service:8001" \
+  -e SECRET_KEY="$SECRET_KEY" \
   -p "8009:8009" \
   beer_review_facade_service
 
@@ -0,0 +1,98 @@
+import os
+import httpx
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+class UpstreamConfig:
+    """Connection settings for one upstream service"""
+    def __init__(self, name: str, timeout: float, connect_timeout: float,
+                 max_connections: int, max_keepalive: int,
+                 keepalive_expiry: float, http2: bool):
+        self.name = name
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+
+    @classmethod
+    def from_env(cls, name: str, default_timeout: float):
+        # per-upstream overrides, e.g. USER_UPSTREAM_TIMEOUT, fall back to UPSTREAM_*
+        prefix = f"{name.upper()}_UPSTREAM_"
+        return cls(
+            name=name,
+            timeout=_env_float(prefix + "TIMEOUT", default_timeout),
+            connect_timeout=_env_float(prefix + "CONNECT_TIMEOUT", _env_float("UPSTREAM_CONNECT_TIMEOUT", 2.0)),
+            max_connections=_env_int(prefix + "MAX_CONNECTIONS", _env_int("UPSTREAM_MAX_CONNECTIONS", 100)),
+            max_keepalive=_env_int(prefix + "MAX_KEEPALIVE", _env_int("UPSTREAM_MAX_KEEPALIVE", 20)),
+            keepalive_expiry=_env_float(prefix + "KEEPALIVE_EXPIRY", _env_float("UPSTREAM_KEEPALIVE_EXPIRY", 30.0)),
+            http2=_env_bool(prefix + "HTTP2", _env_bool("UPSTREAM_HTTP2", False)),
+        )
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamPool:
+    """App-lifetime keep-alive clients, one per upstream service.
+
+    Clients are created on startup and closed on shutdown, so requests reuse
+    pooled connections instead of opening a new one per call.
+    """
+    def __init__(self, configs):
+        self.configs = {cfg.name: cfg for cfg in configs}
+        self._clients = {}
+
+    def _build_client(self, cfg: UpstreamConfig) -> httpx.AsyncClient:
+        http2 = cfg.http2
+        if http2 and not _http2_available():
+            print(f"LOG: HTTP/2 requested for {cfg.name} upstream but 'h2' is not installed, using HTTP/1.1")
+            http2 = False
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(cfg.timeout, connect=cfg.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=cfg.max_connections,
+                max_keepalive_connections=cfg.max_keepalive,
+                keepalive_expiry=cfg.keepalive_expiry,
+            ),
+            http2=http2,
+        )
+
+    async def start(self):
+        for name, cfg in self.configs.items():
+            if name not in self._clients:
+                self._clients[name] = self._build_client(cfg)
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None:
+            # lazily create if used outside of the app lifespan (e.g. scripts)
+            client = self._clients[name] = self._build_client(self.configs[name])
+        return client
+
+
+upstreams = UpstreamPool([
+    UpstreamConfig.from_env("user", default_timeout=5.0),
+    UpstreamConfig.from_env("reviews", default_timeout=10.0),
+    UpstreamConfig.from_env("feed", default_timeout=15.0),
+])
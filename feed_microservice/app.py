@@ -1,17 +1,27 @@
 import os
-import json
+import time
 import uuid
+import asyncio
+import base64
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional
 
 import redis
+from redis import asyncio as aioredis
 import httpx
 import consul
-import random
 import socket
 from fastapi import FastAPI, Depends, HTTPException, Query, Header, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
+from common.discovery import ServiceDiscovery
+from common.balancer import Balancer
+from common import metrics
+from timeline import Timelines, start_timeline_consumer, start_compaction
+from feed_store import FeedStore
+from ranking import Ranker, Affinity
+from common.singleflight import SingleFlight
+from threading import Thread
 
 title = "Feed Service"
 app = FastAPI(title=title)
@@ -19,16 +29,47 @@ app = FastAPI(title=title)
 # CORS
 o = ["*"]
 app.add_middleware(CORSMiddleware, allow_origins=o, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+# per-route request, upstream, Redis and broker metrics at GET /metrics (Prometheus)
+metrics.instrument(app)
 
 env_red = os.getenv('REDIS_HOST', 'redis')
 env_rp = int(os.getenv('REDIS_PORT', 6379))
+env_rmax = int(os.getenv('REDIS_MAX_CONNECTIONS', 100))
+# sync pool for the background timeline threads, async pool for request handlers
 pool = redis.ConnectionPool(host=env_red, port=env_rp, decode_responses=True)
+async_pool = aioredis.ConnectionPool(host=env_red, port=env_rp, decode_responses=True, max_connections=env_rmax)
+# one timed client over the pool; it holds no connection of its own, so requests can share it
+async_redis = metrics.instrument_redis(aioredis.Redis(connection_pool=async_pool))
+feed_store = FeedStore(async_redis)
 
 def get_redis():
-    """Return a Redis client from the connection pool"""
-    return redis.Redis(connection_pool=pool)
+    """Return the async Redis client backed by the connection pool"""
+    return async_redis
 
-TTL = 3600
+# Refresh policy (seconds). A cached feed older than FEED_SOFT_TTL is served
+# as is while one background revalidation runs; after FEED_HARD_TTL it is
+# gone and the next read rebuilds it. A user's feed is never rebuilt more
+# often than FEED_MIN_REFRESH_INTERVAL, and the per-user Redis lock lets only
+# one rebuild run at a time across all feed instances.
+FEED_SOFT_TTL = int(os.getenv('FEED_SOFT_TTL', 300))
+FEED_HARD_TTL = int(os.getenv('FEED_HARD_TTL', 3600))
+FEED_MIN_REFRESH_INTERVAL = int(os.getenv('FEED_MIN_REFRESH_INTERVAL', 30))
+FEED_REFRESH_LOCK_TTL = int(os.getenv('FEED_REFRESH_LOCK_TTL', 30))
+# max reviews kept in a built feed, ranked out of the newest RANK_CANDIDATES unseen ones
+FEED_SIZE = 100
+RANK_CANDIDATES = min(int(os.getenv('RANK_CANDIDATES', 500)), 1000)
+# liked reviews looked at to work out the user's product / beer type affinity
+RANK_PROFILE_LIKES = int(os.getenv('RANK_PROFILE_LIKES', 1000))
+ranker = Ranker()
+# per-call upstream timeouts (seconds); likes are optional, so they get less time
+FEED_VERIFY_TIMEOUT = float(os.getenv('FEED_VERIFY_TIMEOUT', 5))
+FEED_LIKES_TIMEOUT = float(os.getenv('FEED_LIKES_TIMEOUT', 2))
+# keep-alive connections to the user service, shared by all requests
+user_client = httpx.AsyncClient()
+# and to the reviews service, for timeline backfills
+reviews_client = httpx.AsyncClient()
+# concurrent identical user-service calls (same method, path and token) share one request
+user_calls = SingleFlight()
 
 c = consul.Consul(host="consul", port=8500)
 
@@ -65,52 +106,136 @@ class ReviewItem(BaseModel):
 class FeedResponse(BaseModel):
     source: str
     reviews: List[ReviewItem]
+    next_cursor: Optional[str] = None
+    # built without likes (all reviews show liked=False) because they were unavailable
+    degraded: bool = False
 
-def discover(name: str):
-    _, nodes = c.health.service(name, passing=True)
-    return [n['Service']['Port'] for n in nodes]
+# Upstream instances are watched in the background and looked up from memory
+discovery = ServiceDiscovery(['beer_review_user_service', 'reviews-service'])
+
+# Instances are chosen per request by latency and load, skipping failing and outlier ones
+user_lb = Balancer("beer_review_user_service", lambda: discovery.endpoints("beer_review_user_service"),
+                   "http://beer_review_user_service_{port}:{port}")
+reviews_lb = Balancer("reviews-service", lambda: discovery.endpoints("reviews-service"),
+                      "http://reviews_backend_{port}:{port}")
+
+# Reviews are pushed into Redis timelines as they are created (see timeline.py)
+timelines = Timelines(metrics.instrument_redis(redis.Redis(connection_pool=pool)))
+
+async def fetch_recent_reviews(limit: int):
+    """Newest reviews from the reviews service, used to backfill an empty timeline"""
+    r = await reviews_lb.get(reviews_client, "/reviews/", params={"sort": "desc", "limit": limit}, timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+@app.on_event("startup")
+async def startup_event():
+    await discovery.start()
+    # the backfill runs in the consumer thread, but its upstream call runs on the
+    # event loop, which owns the balancer state
+    loop = asyncio.get_running_loop()
+    fetch_recent = lambda limit: asyncio.run_coroutine_threadsafe(fetch_recent_reviews(limit), loop).result()
+    Thread(target=start_timeline_consumer, args=(timelines, fetch_recent), daemon=True).start()
+    Thread(target=start_compaction, args=(timelines,), daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    discovery.stop()
+    await user_client.aclose()
+    await reviews_client.aclose()
+    await async_pool.disconnect()
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"o:{offset}".encode()).decode()
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        kind, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        if kind != "o" or int(offset) < 0:
+            raise ValueError
+        return int(offset)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.get("/health")
 def health():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
-@app.post("/refresh_feed", response_model=FeedResponse)
-async def refresh_feed(authorization: Optional[str] = Header(None), redis_client: redis.Redis = Depends(get_redis)):
-    """Refresh the feed for the user"""
+async def verify_user(authorization: Optional[str]):
+    """Check the bearer token with the user service and return its user info.
+
+    Called once per request; the result is passed on to anything that needs it.
+    """
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    token = authorization.split()[1]
-    async with httpx.AsyncClient() as client:
-        # Verify user
-        uports = discover('beer_review_user_service')
-        up = random.choice(uports)
-        uurl = f"http://beer_review_user_service_{up}:{up}"
-        r = await client.get(f"{uurl}/verify", headers={"Authorization": authorization})
+    return await user_calls.do(("GET", "/verify", authorization), fetch_verify, authorization)
+
+async def fetch_verify(authorization: str):
+    try:
+        r = await user_lb.get(user_client, "/verify", headers={"Authorization": authorization},
+                              timeout=FEED_VERIFY_TIMEOUT)
         r.raise_for_status()
-        user_info = r.json()
-        # Get likes
-        r2 = await client.get(f"{uurl}/likes", headers={"Authorization": authorization})
-        r2.raise_for_status()
-        liked_ids = r2.json()
-        # Get reviews
-        rports = discover('reviews-service')
-        rp = random.choice(rports)
-        rvurl = f"http://reviews_backend_{rp}:{rp}"
-        r3 = await client.get(f"{rvurl}/reviews/")
-        r3.raise_for_status()
-        reviews = r3.json()
-    # Pick last N by created_at and filter out already viewed
-    recent = sorted(reviews, key=lambda x: x['created_at'])[-100:]
-    view_key = f"views:{user_info['user_email']}"
-    # fetch set of already viewed IDs
-    viewed_ids = set(redis_client.smembers(view_key))
-    # select only unseen reviews
-    unseen = [rv for rv in recent if rv['id'] not in viewed_ids]
-    # mark these as viewed
-    reviews_sorted = unseen
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail="Token verification failed")
+    except httpx.RequestError as e:
+        print(f"LOG: User service unavailable for /verify: {e}")
+        raise HTTPException(status_code=503, detail="User service unavailable")
+    return r.json()
+
+async def fetch_liked_ids(authorization: str):
+    return await user_calls.do(("GET", "/likes", authorization), fetch_likes, authorization)
+
+async def fetch_likes(authorization: str):
+    r = await user_lb.get(user_client, "/likes", headers={"Authorization": authorization},
+                          timeout=FEED_LIKES_TIMEOUT)
+    r.raise_for_status()
+    return set(r.json())
+
+async def fetch_like_counts(review_ids):
+    if not review_ids:
+        return {}
+    r = await user_lb.post(user_client, "/likes/counts", json={"post_ids": review_ids},
+                           timeout=FEED_LIKES_TIMEOUT)
+    r.raise_for_status()
+    return r.json()
+
+async def build_feed(authorization: str, user_email: str):
+    """Rebuild and cache the user's feed; callers hold the user's refresh lock.
+
+    Likes (user service) and the unseen timeline slice (Redis) are fetched
+    concurrently, then the candidates' like counts and the user's liked
+    reviews, which feed the ranking (see ranking.py). Without likes the feed
+    is still built, with liked=False and less personal ranking, and flagged
+    as degraded. Returns (items, degraded).
+    """
+    liked_ids, unseen = await asyncio.gather(
+        fetch_liked_ids(authorization),
+        # Newest reviews from the user's timeline minus already viewed ones, in one round trip
+        feed_store.candidates(user_email, limit=RANK_CANDIDATES),
+        return_exceptions=True,
+    )
+    if isinstance(unseen, BaseException):
+        raise unseen
+    degraded = isinstance(liked_ids, BaseException)
+    if degraded:
+        print(f"LOG: Likes unavailable for {user_email}, building degraded feed: {liked_ids!r}")
+        liked_ids = set()
+    like_counts, liked_reviews = await asyncio.gather(
+        fetch_like_counts([rv['id'] for rv in unseen]),
+        feed_store.reviews(list(liked_ids)[:RANK_PROFILE_LIKES]),
+        return_exceptions=True,
+    )
+    if isinstance(liked_reviews, BaseException):
+        raise liked_reviews
+    if isinstance(like_counts, BaseException):
+        print(f"LOG: Like counts unavailable, ranking without them: {like_counts!r}")
+        like_counts = {}
+        degraded = True
+    affinity = Affinity.from_liked(liked_reviews, ranker.beer_types)
+    ranked = ranker.rank(unseen, like_counts, affinity, time.time(), limit=FEED_SIZE)
     items = []
-    for rv in reviews_sorted:
+    for rv in ranked:
         # match likes by explicit id field
         liked = rv.get('id') in liked_ids
         items.append(ReviewItem(
@@ -126,46 +251,104 @@ async def refresh_feed(authorization: Optional[str] = Header(None), redis_client
             liked=liked
         ))
     # Cache
-    user_key = f"feed:{user_info['user_email']}"
-    redis_client.setex(user_key, TTL, json.dumps([i.dict() for i in items], default=str))
-    return FeedResponse(source="fresh", reviews=items)
+    await feed_store.save(user_email, [i.dict() for i in items], FEED_HARD_TTL, degraded=degraded)
+    return items, degraded
+
+async def wait_for_refresh(user_email: str):
+    """Wait until another instance's rebuild of this feed releases its lock"""
+    deadline = time.monotonic() + FEED_REFRESH_LOCK_TTL
+    while time.monotonic() < deadline and await feed_store.refresh_locked(user_email):
+        await asyncio.sleep(0.05)
+
+async def refresh_once(authorization: str, user_email: str):
+    """Rebuild the feed unless a rebuild for this user is already running anywhere.
+
+    Returns build_feed's (items, degraded), or None if another rebuild was
+    running (it has finished or timed out by the time this returns).
+    """
+    token = await feed_store.acquire_refresh(user_email, FEED_REFRESH_LOCK_TTL * 1000)
+    if token is None:
+        await wait_for_refresh(user_email)
+        return None
+    try:
+        return await build_feed(authorization, user_email)
+    finally:
+        await feed_store.release_refresh(user_email, token)
+
+async def revalidate(authorization: str, user_email: str):
+    """Background refresh of a stale feed; skipped if one is already running"""
+    token = await feed_store.acquire_refresh(user_email, FEED_REFRESH_LOCK_TTL * 1000)
+    if token is None:
+        return
+    try:
+        await build_feed(authorization, user_email)
+    except Exception as e:
+        print(f"LOG: Feed revalidation for {user_email} failed: {e}")
+    finally:
+        await feed_store.release_refresh(user_email, token)
+
+def should_revalidate(meta: dict, exhausted: bool) -> bool:
+    age = time.time() - meta["refreshed_at"]
+    if age < FEED_MIN_REFRESH_INTERVAL:
+        return False
+    return exhausted or meta["degraded"] or age >= FEED_SOFT_TTL
+
+@app.post("/refresh_feed", response_model=FeedResponse)
+async def refresh_feed(authorization: Optional[str] = Header(None), redis_client: aioredis.Redis = Depends(get_redis)):
+    """Refresh the feed for the user"""
+    user_info = await verify_user(authorization)
+    built = await refresh_once(authorization, user_info['user_email'])
+    if built is not None:
+        items, degraded = built
+        return FeedResponse(source="fresh", reviews=items, degraded=degraded)
+    # a concurrent refresh just rebuilt it
+    page = await feed_store.page(user_info['user_email'], 0, FEED_SIZE)
+    if page is None:
+        raise HTTPException(status_code=500, detail="Unable to refresh feed")
+    items, _, meta = page
+    return FeedResponse(source="cache", reviews=[ReviewItem(**i) for i in items], degraded=meta["degraded"])
+
+async def load_feed(authorization: str, user_email: str, read):
+    """Run `read`, rebuilding the feed first if it is not cached (hard TTL expired)"""
+    result = await read()
+    if result is None:
+        # Cache miss -> refresh (or wait for the refresh already running) and reload from Redis
+        await refresh_once(authorization, user_email)
+        result = await read()
+        if result is None:
+            raise HTTPException(status_code=500, detail="Unable to refresh feed")
+    return result
 
 @app.get("/feed", response_model=FeedResponse)
 async def get_feed(
+    limit: int = Query(3, ge=1, le=100),
+    consume: bool = True,
+    cursor: Optional[str] = None,
     authorization: Optional[str] = Header(None),
-    redis_client: redis.Redis = Depends(get_redis),
+    redis_client: aioredis.Redis = Depends(get_redis),
     background_tasks: BackgroundTasks = None
 ):
-    """Get the cached feed for the user"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    token = authorization.split()[1]
-    # Parse user_email from token via user service
-    async with httpx.AsyncClient() as client:
-        uports = discover('beer_review_user_service')
-        up = random.choice(uports)
-        uurl = f"http://beer_review_user_service_{up}:{up}"
-        r = await client.get(f"{uurl}/verify", headers={"Authorization": authorization})
-        r.raise_for_status()
-        user_email = r.json().get('user_email')
-    key = f"feed:{user_email}"
-    data = redis_client.get(key)
-    if not data:
-        # Cache miss, refresh feed
-        # Cache miss -> force a refresh and then reload from Redis
-        await refresh_feed(authorization=authorization, redis_client=redis_client)
-        data = redis_client.get(key)
-        if not data:
-            raise HTTPException(status_code=500, detail="Unable to refresh feed")
-    items = json.loads(data)
-    # return only first 3 reviews
-    sliced = items[:3]
-    # mark only the returned reviews as viewed
-    if sliced:
-        view_key = f"views:{user_email}"
-        redis_client.sadd(view_key, *[i['id'] for i in sliced])
-    # schedule background refresh to update cache
-    if background_tasks:
-        background_tasks.add_task(refresh_feed, authorization, redis_client)
-    return FeedResponse(source="cache", reviews=[ReviewItem(**i) for i in sliced])
+    """Get the cached feed for the user.
 
+    By default the next `limit` items are served and removed from the feed
+    (and marked as viewed). With consume=false the feed is paged through
+    without consuming it, continuing from the previous page's next_cursor.
+    A stale feed is served immediately and revalidated in the background.
+    """
+    user_email = (await verify_user(authorization)).get('user_email')
+    if not consume:
+        offset = decode_cursor(cursor) if cursor else 0
+        items, has_more, meta = await load_feed(
+            authorization, user_email, lambda: feed_store.page(user_email, offset, limit))
+        exhausted = not has_more
+        next_cursor = encode_cursor(offset + limit) if has_more else None
+    else:
+        # pop the next reviews and mark them as viewed, atomically
+        items, meta = await load_feed(
+            authorization, user_email, lambda: feed_store.take(user_email, limit))
+        exhausted = len(items) < limit
+        next_cursor = None
+    if background_tasks and should_revalidate(meta, exhausted):
+        background_tasks.add_task(revalidate, authorization, user_email)
+    return FeedResponse(source="cache", reviews=[ReviewItem(**i) for i in items], next_cursor=next_cursor,
+                        degraded=meta["degraded"])
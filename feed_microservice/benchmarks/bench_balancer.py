@@ -0,0 +1,102 @@
+"""Upstream tail latency with one slow replica: random choice vs. balancer.
+
+Needs no running services; replicas are simulated in-process behind an
+httpx mock transport:
+
+    python benchmarks/bench_balancer.py --replicas 5 --slow-factor 10 --requests 5000
+
+Each replica serves `--workers` requests at a time (more queue up) with
+log-normal service times around `--latency` ms; one of them is
+`--slow-factor` times slower, like a degraded reviews container. "random"
+replays the original `random.choice(ports)`; "p2c" is Balancer with hedging
+off; "p2c+hedge" also hedges GETs after the recent p95.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from common.balancer import Balancer  # noqa: E402
+
+
+class Replicas:
+    def __init__(self, count: int, workers: int, latency: float, slow_factor: float, jitter: float):
+        self.endpoints = [("replica", 9000 + i) for i in range(count)]
+        self.slots = {port: asyncio.Semaphore(workers) for _, port in self.endpoints}
+        self.latency = latency
+        self.slow_port = 9000
+        self.slow_factor = slow_factor
+        self.jitter = jitter
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        port = request.url.port
+        median = self.latency * (self.slow_factor if port == self.slow_port else 1)
+        async with self.slots[port]:
+            await asyncio.sleep(median * random.lognormvariate(0, self.jitter))
+        return httpx.Response(200, json={"port": port})
+
+
+def percentile(ordered, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+
+async def run(replicas: Replicas, send, total: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            response = await send()
+            response.raise_for_status()
+            timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return sorted(timings), total / (time.perf_counter() - start)
+
+
+async def main(args):
+    replicas = Replicas(args.replicas, args.workers, args.latency / 1000, args.slow_factor, args.jitter)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(replicas.handle))
+    template = "http://replica{port}:{port}"
+
+    async def send_random():
+        _, port = random.choice(replicas.endpoints)
+        return await client.get(template.format(port=port) + "/reviews/")
+
+    modes = [("random", send_random, None)]
+    for name, hedge in (("p2c", False), ("p2c+hedge", True)):
+        lb = Balancer("reviews-service", lambda: replicas.endpoints, template, hedge=hedge)
+        modes.append((name, lambda lb=lb: lb.get(client, "/reviews/"), lb))
+
+    print(f"{args.replicas} replicas, one {args.slow_factor:g}x slower; "
+          f"{args.requests} requests, {args.concurrency} in flight")
+    print(f"{'mode':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'req/s':>7} {'hedged':>7}")
+    for name, send, lb in modes:
+        # warm-up fills the balancer's latency estimates, as live traffic would
+        await run(replicas, send, args.requests // 10, args.concurrency)
+        if lb is not None:
+            lb.requests = lb.hedged = 0
+        timings, rps = await run(replicas, send, args.requests, args.concurrency)
+        hedged = f"{lb.hedged / lb.requests:.1%}" if lb is not None and lb.requests else "-"
+        print(f"{name:>10} {percentile(timings, 0.5):>8.1f} {percentile(timings, 0.95):>8.1f} "
+              f"{percentile(timings, 0.99):>8.1f} {timings[-1] * 1000:>8.1f} {rps:>7.0f} {hedged:>7}")
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replicas", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=8, help="concurrent requests each replica serves")
+    parser.add_argument("--latency", type=float, default=10.0, help="median service time (ms)")
+    parser.add_argument("--slow-factor", type=float, default=10.0)
+    parser.add_argument("--jitter", type=float, default=0.5, help="sigma of the log-normal service time")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,105 @@
+"""Feed reads/sec: blocking redis-py round trips vs. async client + Lua script.
+
+Runs against a local redis-server (uses DB 15 and flushes it):
+
+    python benchmarks/bench_redis.py --host localhost --requests 5000
+
+"blocking" replays the original GET /feed path: a synchronous GET of the
+whole feed blob, json.loads, slicing, then a separate SADD, all on the event
+loop. "async" is FeedStore.take on the paged layout: one EVALSHA round trip
+on the async pool that pops only the requested items.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import redis
+from redis import asyncio as aioredis
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from feed_store import FeedStore, views_key  # noqa: E402
+
+USERS = [f"user{i}@example.com" for i in range(200)]
+
+
+def blob_key(user: str) -> str:
+    # layout of the original single-blob feed
+    return f"feed:{user}"
+
+
+async def seed(client: redis.Redis, store: FeedStore, items: int):
+    client.flushdb()
+    feed = [
+        {"id": f"r{i}", "headline": "h", "review": "Crisp and malty. " * 10, "rating": 4,
+         "product_id": "p", "user_email": "a@example.com", "user_nickname": "a",
+         "created_at": "2025-01-01T00:00:00", "updated_at": "2025-01-01T00:00:00", "liked": False}
+        for i in range(items)
+    ]
+    blob = json.dumps(feed)
+    pipe = client.pipeline()
+    for user in USERS:
+        pipe.set(blob_key(user), blob)
+    pipe.execute()
+    for user in USERS:
+        # paged feeds are consumed as they are read, so give them room to spare
+        await store.save(user, feed * 5, 3600)
+
+
+async def run_blocking(client: redis.Redis, total: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            user = random.choice(USERS)
+            items = json.loads(client.get(blob_key(user)))[:3]
+            client.sadd(views_key(user), *[i["id"] for i in items])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def run_async(store: FeedStore, total: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await store.take(random.choice(USERS), 3)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(args):
+    sync_client = redis.Redis(host=args.host, port=args.port, db=15, decode_responses=True)
+    async_client = aioredis.Redis(
+        connection_pool=aioredis.ConnectionPool(host=args.host, port=args.port, db=15,
+                                                decode_responses=True, max_connections=args.pool))
+    store = FeedStore(async_client)
+    await seed(sync_client, store, args.items)
+    await run_async(store, 100, 4)
+    print(f"feed size: {args.items} items")
+    print(f"{'in-flight':>10} {'blocking req/s':>16} {'async+lua req/s':>17}")
+    for concurrency in args.levels:
+        blocking = await run_blocking(sync_client, args.requests, concurrency)
+        async_rps = await run_async(store, args.requests, concurrency)
+        print(f"{concurrency:>10} {blocking:>16.0f} {async_rps:>17.0f}")
+    sync_client.flushdb()
+    await async_client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("REDIS_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("REDIS_PORT", 6379)))
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--pool", type=int, default=100)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64])
+    asyncio.run(main(parser.parse_args()))
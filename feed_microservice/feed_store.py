@@ -0,0 +1,171 @@
+import json
+import time
+import uuid
+from redis import asyncio as aioredis
+from timeline import RECENT_KEY, ACTIVE_KEY, TIMELINE_USER_SIZE, user_timeline_key, review_key
+from seen import SeenBackend, seen_backend_from_env
+
+# Multi-step feed operations run as Lua scripts, so each one is a single,
+# atomic Redis round trip. Review records are read by key inside the scripts
+# (review:{id}); that is fine for the single Redis node the feed uses.
+# Both scripts are prefixed with the seen backend's Lua functions
+# (seen_is / seen_mark, see seen.py).
+
+# KEYS: user timeline, global timeline, seen key, active users
+# ARGV: limit, now, user timeline size, user email
+# Marks the user active, seeds their timeline from the global one if it does
+# not exist yet, and returns the unseen review records among the newest `limit`.
+CANDIDATES_SCRIPT = """
+redis.call('ZADD', KEYS[4], ARGV[2], ARGV[4])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local recent = redis.call('ZREVRANGE', KEYS[2], 0, tonumber(ARGV[3]) - 1, 'WITHSCORES')
+    for i = 1, #recent, 2 do
+        redis.call('ZADD', KEYS[1], recent[i + 1], recent[i])
+    end
+end
+local ids = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+local out = {}
+for i = #ids, 1, -1 do
+    if not seen_is(KEYS[3], ids[i]) then
+        local record = redis.call('GET', 'review:' .. ids[i])
+        if record then
+            out[#out + 1] = record
+        end
+    end
+end
+return out
+"""
+
+# KEYS: feed items list, seen key, feed meta, user timeline
+# ARGV: count, now
+# Pops the first `count` feed items (JSON records), marks them as seen (scored
+# by their timeline score, i.e. created_at) and returns
+# {refreshed_at, degraded, items}, or nil when there is no cached feed.
+TAKE_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 0 then
+    return false
+end
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    local ids, scores = {}, {}
+    for i = 1, #items do
+        ids[i] = cjson.decode(items[i])['id']
+        scores[i] = tonumber(redis.call('ZSCORE', KEYS[4], ids[i]) or ARGV[2])
+    end
+    seen_mark(KEYS[2], ids, scores, tonumber(ARGV[2]))
+end
+local meta = redis.call('HMGET', KEYS[3], 'refreshed_at', 'degraded')
+return {meta[1] or '0', meta[2] or '0', items}
+"""
+
+# KEYS: refresh lock
+# ARGV: owner token
+# Releases the lock only if it is still held by this owner.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+# feed items live in a list of per-item records; the meta hash marks a cached
+# (possibly empty) feed and holds its bookkeeping
+def feed_key(email: str) -> str:
+    return f"feeditems:{email}"
+
+def feed_meta_key(email: str) -> str:
+    return f"feedmeta:{email}"
+
+def views_key(email: str) -> str:
+    return f"views:{email}"
+
+def refresh_lock_key(email: str) -> str:
+    return f"feedlock:{email}"
+
+def feed_meta(refreshed_at, degraded) -> dict:
+    return {"refreshed_at": float(refreshed_at), "degraded": degraded == "1"}
+
+
+class FeedStore:
+    """Async Redis access for the request path of the feed service"""
+    def __init__(self, redis_client: aioredis.Redis, seen: SeenBackend = None):
+        self.redis = redis_client
+        self.seen = seen or seen_backend_from_env()
+        self._candidates = redis_client.register_script(self.seen.lua + CANDIDATES_SCRIPT)
+        self._take = redis_client.register_script(self.seen.lua + TAKE_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    async def candidates(self, email: str, limit: int = 100):
+        """Unseen review records from the user's timeline, oldest first (one round trip)"""
+        records = await self._candidates(
+            keys=[user_timeline_key(email), RECENT_KEY, self.seen.key(email), ACTIVE_KEY],
+            args=[limit, time.time(), TIMELINE_USER_SIZE, email],
+        )
+        return [json.loads(r) for r in records]
+
+    async def reviews(self, ids):
+        """Review records still on the timelines for the given ids (one MGET)"""
+        if not ids:
+            return []
+        records = await self.redis.mget([review_key(i) for i in ids])
+        return [json.loads(r) for r in records if r]
+
+    async def save(self, email: str, items, ttl: int, degraded: bool = False):
+        """Replace the user's cached feed with `items` (one atomic round trip).
+
+        `degraded` records that the feed was built without some upstream data.
+        """
+        key, meta = feed_key(email), feed_meta_key(email)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key)
+        if items:
+            pipe.rpush(key, *[json.dumps(i, default=str) for i in items])
+            pipe.expire(key, ttl)
+        pipe.hset(meta, mapping={"refreshed_at": time.time(), "size": len(items), "degraded": int(degraded)})
+        pipe.expire(meta, ttl)
+        await pipe.execute()
+
+    async def take(self, email: str, count: int):
+        """Pop the first `count` items and mark them seen (one round trip).
+
+        Returns (items, meta), or None if no feed is cached; meta holds the
+        feed's `refreshed_at` and `degraded` flag.
+        """
+        result = await self._take(
+            keys=[feed_key(email), self.seen.key(email), feed_meta_key(email), user_timeline_key(email)],
+            args=[count, time.time()],
+        )
+        if result is None:
+            return None
+        refreshed_at, degraded, records = result
+        return [json.loads(r) for r in records], feed_meta(refreshed_at, degraded)
+
+    async def page(self, email: str, offset: int, count: int):
+        """Read items [offset, offset + count) without consuming them.
+
+        Returns (items, has_more, meta), or None if no feed is cached
+        (one round trip).
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hmget(feed_meta_key(email), "refreshed_at", "degraded")
+        pipe.lrange(feed_key(email), offset, offset + count - 1)
+        pipe.llen(feed_key(email))
+        (refreshed_at, degraded), records, length = await pipe.execute()
+        if refreshed_at is None:
+            return None
+        return [json.loads(r) for r in records], offset + count < length, feed_meta(refreshed_at, degraded)
+
+    async def acquire_refresh(self, email: str, ttl_ms: int):
+        """Take the user's refresh lock (shared by all feed instances); returns an owner token or None"""
+        token = uuid.uuid4().hex
+        if await self.redis.set(refresh_lock_key(email), token, nx=True, px=ttl_ms):
+            return token
+        return None
+
+    async def release_refresh(self, email: str, token: str):
+        await self._release(keys=[refresh_lock_key(email)], args=[token])
+
+    async def refresh_locked(self, email: str) -> bool:
+        return bool(await self.redis.exists(refresh_lock_key(email)))
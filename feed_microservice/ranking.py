@@ -0,0 +1,133 @@
+import os
+import csv
+from collections import Counter
+import numpy as np
+from timeline import to_timestamp
+
+# seconds for a review's recency factor to halve
+RANK_HALF_LIFE = float(os.getenv('RANK_HALF_LIFE', 24 * 3600))
+# product_id -> beer Type comes from the facade's beer catalog
+BEER_CATALOG = os.getenv('BEER_CATALOG', os.path.join(os.path.dirname(__file__), '..', 'facade_microservice', 'beer.csv'))
+
+
+def load_beer_types(path: str = BEER_CATALOG) -> dict:
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            return {row['Name']: row.get('Type') for row in csv.DictReader(f) if row.get('Name')}
+    except FileNotFoundError:
+        print(f"LOG: Beer catalog not found at {path}, type affinity disabled")
+        return {}
+
+
+class RankWeights:
+    """Weights of the ranking model; every factor is scaled to [0, 1] before weighting"""
+    def __init__(self, recency: float = 1.0, rating: float = 0.5, likes: float = 0.5,
+                 product_affinity: float = 0.4, type_affinity: float = 0.2, diversity: float = 0.5):
+        self.recency = recency
+        self.rating = rating
+        self.likes = likes
+        self.product_affinity = product_affinity
+        self.type_affinity = type_affinity
+        self.diversity = diversity
+
+    @classmethod
+    def from_env(cls):
+        defaults = cls()
+        return cls(**{
+            name: float(os.getenv(f'RANK_W_{name.upper()}', value))
+            for name, value in vars(defaults).items()
+        })
+
+
+class Affinity:
+    """A user's taste: how much of their liking goes to each product and beer type.
+
+    Shares are relative to the user's favourite, so the top product (type) is 1.
+    """
+    def __init__(self, products: dict = None, types: dict = None):
+        self.products = products or {}
+        self.types = types or {}
+
+    @classmethod
+    def from_liked(cls, liked_reviews, beer_types: dict):
+        products = Counter(r.get('product_id') for r in liked_reviews if r.get('product_id'))
+        types = Counter()
+        for product, n in products.items():
+            if beer_types.get(product):
+                types[beer_types[product]] += n
+        return cls(_relative(products), _relative(types))
+
+
+def _relative(counts: Counter) -> dict:
+    top = max(counts.values(), default=0)
+    return {k: v / top for k, v in counts.items()} if top else {}
+
+
+class Ranker:
+    """Scores feed candidates with a weighted model over NumPy arrays.
+
+    score = w.recency * 2^(-age / half_life)
+          + w.rating * (rating - 1) / 4
+          + w.likes * log1p(likes) / log1p(max likes among candidates)
+          + w.product_affinity * affinity(product) + w.type_affinity * affinity(type)
+          - w.diversity * (1 - 2^-k), k = better-scored candidates by the same author
+    """
+    def __init__(self, weights: RankWeights = None, half_life: float = RANK_HALF_LIFE, beer_types: dict = None):
+        self.weights = weights or RankWeights.from_env()
+        self.half_life = half_life
+        self.beer_types = load_beer_types() if beer_types is None else beer_types
+
+    def score(self, now: float, created_at, rating, like_counts, product_affinity, type_affinity):
+        """Base score of each candidate, before the author diversity penalty"""
+        w = self.weights
+        recency = np.exp2(-np.maximum(now - created_at, 0.0) / self.half_life)
+        rating = np.clip((rating - 1.0) / 4.0, 0.0, 1.0)
+        likes = np.log1p(like_counts)
+        peak = likes.max(initial=0.0)
+        if peak > 0:
+            likes /= peak
+        return (w.recency * recency + w.rating * rating + w.likes * likes
+                + w.product_affinity * product_affinity + w.type_affinity * type_affinity)
+
+    def diversify(self, scores, authors):
+        """Penalize each author's 2nd, 3rd, ... best candidate (authors are int codes)"""
+        n = len(scores)
+        if n == 0 or self.weights.diversity == 0:
+            return scores
+        # position of each candidate in overall score order, then group by
+        # author keeping that order: one int64 sort instead of a lexsort
+        position = np.empty(n, dtype=np.int64)
+        position[np.argsort(-scores)] = np.arange(n)
+        grouped = np.argsort(authors.astype(np.int64) * n + position)
+        sorted_authors = authors[grouped]
+        starts = np.flatnonzero(np.r_[True, sorted_authors[1:] != sorted_authors[:-1]])
+        group_start = np.repeat(starts, np.diff(np.r_[starts, n]))
+        rank_in_group = np.empty(n)
+        rank_in_group[grouped] = np.arange(n) - group_start
+        return scores - self.weights.diversity * (1.0 - np.exp2(-rank_in_group))
+
+    def order(self, now: float, created_at, rating, like_counts, product_affinity, type_affinity, authors,
+              limit: int = None):
+        """Indices of the best `limit` (default: all) candidates, best first"""
+        scores = -self.diversify(
+            self.score(now, created_at, rating, like_counts, product_affinity, type_affinity), authors)
+        if limit is not None and limit < len(scores):
+            top = np.argpartition(scores, limit)[:limit]
+            return top[np.argsort(scores[top])]
+        return np.argsort(scores)
+
+    def rank(self, candidates, like_counts: dict, affinity: Affinity, now: float, limit: int = None):
+        """Sort candidate review records best first, keeping at most `limit`"""
+        if not candidates:
+            return []
+        n = len(candidates)
+        created_at = np.fromiter((to_timestamp(c['created_at']) for c in candidates), float, n)
+        rating = np.fromiter((float(c.get('rating') or 0) for c in candidates), float, n)
+        likes = np.fromiter((like_counts.get(c['id'], 0) for c in candidates), float, n)
+        # per-value lookups only run over the distinct products, not every candidate
+        products, product_idx = np.unique([c.get('product_id') or '' for c in candidates], return_inverse=True)
+        product_aff = np.array([affinity.products.get(p, 0.0) for p in products])[product_idx]
+        type_aff = np.array([affinity.types.get(self.beer_types.get(p), 0.0) for p in products])[product_idx]
+        _, authors = np.unique([c.get('user_email') or '' for c in candidates], return_inverse=True)
+        best = self.order(now, created_at, rating, likes, product_aff, type_aff, authors, limit)
+        return [candidates[i] for i in best]
@@ -0,0 +1,156 @@
+import os
+import math
+from abc import ABC, abstractmethod
+from timeline import TIMELINE_RETENTION
+
+# Which backend tracks the reviews a user has already been served:
+#   set    - exact Redis set, capped at SEEN_MAX_ITEMS (random eviction) with a TTL
+#   window - sorted set scored by review age; entries older than SEEN_TTL or beyond
+#            SEEN_MAX_ITEMS (oldest first) are dropped
+#   bloom  - scalable Bloom filter: up to SEEN_BLOOM_GENERATIONS bitmaps of
+#            SEEN_MAX_ITEMS entries each at SEEN_FP_RATE, oldest generation dropped
+SEEN_BACKEND = os.getenv("SEEN_BACKEND", "window")
+SEEN_TTL = int(os.getenv("SEEN_TTL", TIMELINE_RETENTION))
+SEEN_MAX_ITEMS = int(os.getenv("SEEN_MAX_ITEMS", 5000))
+SEEN_FP_RATE = float(os.getenv("SEEN_FP_RATE", 0.01))
+SEEN_BLOOM_GENERATIONS = int(os.getenv("SEEN_BLOOM_GENERATIONS", 4))
+
+
+class SeenBackend(ABC):
+    """Seen-tracking as Lua fragments spliced into the feed scripts.
+
+    Each backend defines two Lua functions over its per-user base key:
+    `seen_is(key, id)` and `seen_mark(key, ids, scores, now)`, where scores
+    are the reviews' created_at timestamps. Keeping them in Lua lets the feed
+    scripts check a whole candidate batch, or mark a served page, inside the
+    same single round trip.
+    """
+    name = None
+    lua = ""
+
+    @abstractmethod
+    def key(self, email: str) -> str:
+        """The user's base key in Redis"""
+
+
+class SetSeen(SeenBackend):
+    name = "set"
+
+    def __init__(self, ttl: int = SEEN_TTL, max_items: int = SEEN_MAX_ITEMS):
+        self.lua = f"""
+local function seen_is(key, id)
+    return redis.call('SISMEMBER', key, id) == 1
+end
+local function seen_mark(key, ids, scores, now)
+    if #ids == 0 then return end
+    redis.call('SADD', key, unpack(ids))
+    local excess = redis.call('SCARD', key) - {max_items}
+    if excess > 0 then
+        redis.call('SPOP', key, excess)
+    end
+    redis.call('EXPIRE', key, {ttl})
+end
+"""
+
+    def key(self, email: str) -> str:
+        # same key the feed has always used
+        return f"views:{email}"
+
+
+class WindowSeen(SeenBackend):
+    name = "window"
+
+    def __init__(self, ttl: int = SEEN_TTL, max_items: int = SEEN_MAX_ITEMS):
+        self.lua = f"""
+local function seen_is(key, id)
+    return redis.call('ZSCORE', key, id) ~= false
+end
+local function seen_mark(key, ids, scores, now)
+    if #ids == 0 then return end
+    for i = 1, #ids do
+        redis.call('ZADD', key, scores[i], ids[i])
+    end
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - {ttl})
+    redis.call('ZREMRANGEBYRANK', key, 0, -{max_items + 1})
+    redis.call('EXPIRE', key, {ttl})
+end
+"""
+
+    def key(self, email: str) -> str:
+        return f"seen:window:{email}"
+
+
+class BloomSeen(SeenBackend):
+    """Scalable Bloom filter made of per-generation Redis bitmaps.
+
+    Each generation holds `capacity` ids at false-positive rate `fp_rate`.
+    When it fills up, a new one is started and the oldest beyond
+    `generations` is deleted. The effective false-positive rate is at most
+    generations x fp_rate. Positions come from double hashing of SHA-1.
+    """
+    name = "bloom"
+
+    def __init__(self, ttl: int = SEEN_TTL, capacity: int = SEEN_MAX_ITEMS,
+                 fp_rate: float = SEEN_FP_RATE, generations: int = SEEN_BLOOM_GENERATIONS):
+        self.bits = max(8, int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self.lua = f"""
+local function bloom_positions(id)
+    local h = redis.sha1hex(id)
+    local h1 = tonumber(string.sub(h, 1, 8), 16)
+    local h2 = tonumber(string.sub(h, 9, 16), 16)
+    local pos = {{}}
+    for i = 0, {self.hashes - 1} do
+        pos[#pos + 1] = (h1 + i * h2) % {self.bits}
+    end
+    return pos
+end
+local function seen_is(key, id)
+    local gen = tonumber(redis.call('HGET', key, 'gen') or '-1')
+    if gen < 0 then return false end
+    local pos = bloom_positions(id)
+    for g = math.max(0, gen - {generations - 1}), gen do
+        local hit = true
+        for _, p in ipairs(pos) do
+            if redis.call('GETBIT', key .. ':' .. g, p) == 0 then
+                hit = false
+                break
+            end
+        end
+        if hit then return true end
+    end
+    return false
+end
+local function seen_mark(key, ids, scores, now)
+    if #ids == 0 then return end
+    local gen = tonumber(redis.call('HGET', key, 'gen') or '0')
+    local count = tonumber(redis.call('HGET', key, 'count') or '0')
+    for _, id in ipairs(ids) do
+        if count >= {capacity} then
+            gen = gen + 1
+            count = 0
+            redis.call('DEL', key .. ':' .. (gen - {generations}))
+        end
+        for _, p in ipairs(bloom_positions(id)) do
+            redis.call('SETBIT', key .. ':' .. gen, p, 1)
+        end
+        count = count + 1
+    end
+    redis.call('HSET', key, 'gen', gen, 'count', count)
+    redis.call('EXPIRE', key, {ttl})
+    redis.call('EXPIRE', key .. ':' .. gen, {ttl})
+end
+"""
+
+    def key(self, email: str) -> str:
+        return f"seen:bloom:{email}"
+
+
+BACKENDS = {cls.name: cls for cls in (SetSeen, WindowSeen, BloomSeen)}
+
+
+def seen_backend_from_env() -> SeenBackend:
+    try:
+        return BACKENDS[SEEN_BACKEND]()
+    except KeyError:
+        raise ValueError(f"Unknown SEEN_BACKEND {SEEN_BACKEND!r}, expected one of {sorted(BACKENDS)}")
@@ -27,7 +27,8 @@ sudo docker run -d --name "$REDIS_CONTAINER" \
     --network "$NETWORK_NAME" \
     redis:alpine
 
-sudo docker build -t "$APP_IMAGE" .
+# the repo root is the build context, so the image can copy common/
+sudo docker build -t "$APP_IMAGE" -f dockerfile ..
 # Stop and remove any existing containers
 echo "Cleaning up any existing service containers..."
 for container in $(sudo docker ps -a --filter "name=$APP_CONTAINER_PREFIX-*" --format "{{.Names}}"); do
@@ -0,0 +1,22 @@
+"""Recompute the product_stats collection from all reviews.
+
+Recovery job for when the incremental aggregates drifted (e.g. a crash
+between a review write and its stats update):
+
+    python rebuild_stats.py
+"""
+import asyncio
+from repository import ReviewRepository
+
+
+async def main():
+    repo = ReviewRepository()
+    try:
+        await repo.rebuild_product_stats()
+        print(f"LOG: Rebuilt product_stats for {await repo.product_stats.count_documents({})} products")
+    finally:
+        repo.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,22 @@
+"""Re-index the trigrams of all reviews into review_trigrams.
+
+Recovery job for keyword search (e.g. after restoring reviews from a backup):
+
+    python rebuild_trigrams.py
+"""
+import asyncio
+from repository import ReviewRepository
+
+
+async def main():
+    repo = ReviewRepository()
+    try:
+        await repo.ensure_indexes()
+        await repo.rebuild_trigrams()
+        print(f"LOG: Indexed trigrams of {await repo.review_trigrams.count_documents({})} reviews")
+    finally:
+        repo.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
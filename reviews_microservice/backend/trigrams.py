@@ -0,0 +1,27 @@
+import re
+
+# fields covered by keyword search
+SEARCH_FIELDS = ("headline", "review")
+
+
+def normalize(text: str) -> str:
+    return (text or "").casefold()
+
+def trigrams(text: str) -> set:
+    """Distinct 3-character substrings of already normalized text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def review_grams(doc: dict) -> list:
+    """Trigrams of a review's searchable fields, as stored in review_trigrams"""
+    grams = set()
+    for field in SEARCH_FIELDS:
+        grams |= trigrams(normalize(doc.get(field)))
+    return sorted(grams)
+
+def matches(doc: dict, needle: str) -> bool:
+    """Case-insensitive substring check of a normalized keyword against the review"""
+    return any(needle in normalize(doc.get(field)) for field in SEARCH_FIELDS)
+
+def literal_regex(keyword: str) -> dict:
+    # the keyword is matched literally, never interpreted as a pattern
+    return {"$regex": re.escape(keyword), "$options": "i"}
@@ -0,0 +1,97 @@
+"""Requests/sec vs. in-flight requests: blocking pymongo vs. the async repository.
+
+Runs against a local mongod (no auth by default) in a throwaway database:
+
+    python benchmarks/bench_concurrency.py --uri mongodb://localhost:27017/ --requests 2000
+
+The "pymongo" column replays the old handler behaviour (a synchronous query
+inside a coroutine), the "repository" column goes through ReviewRepository.
+With a blocking driver throughput stays flat as concurrency grows; with the
+async repository it scales until the pool or the server saturates.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from repository import ReviewRepository  # noqa: E402
+
+BENCH_DB = "reviews_bench"
+PRODUCTS = [f"beer-{i}" for i in range(50)]
+
+
+def seed(uri: str, count: int):
+    coll = MongoClient(uri)[BENCH_DB]["reviews"]
+    coll.drop()
+    start = datetime.utcnow() - timedelta(days=30)
+    coll.insert_many([
+        {
+            "headline": f"Review {i}",
+            "review": "Crisp, malty, a little bitter. " * 5,
+            "rating": random.randint(1, 5),
+            "product_id": random.choice(PRODUCTS),
+            "user_email": f"user{i % 500}@example.com",
+            "created_at": start + timedelta(seconds=i),
+            "updated_at": start + timedelta(seconds=i),
+        }
+        for i in range(count)
+    ])
+    coll.create_index([("product_id", 1), ("created_at", 1), ("_id", 1)])
+
+
+async def run_blocking(coll, total: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            # what the handlers used to do: a synchronous driver call on the event loop
+            list(coll.find({"product_id": random.choice(PRODUCTS)}).sort("created_at", -1).limit(20))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def run_repository(repo: ReviewRepository, total: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await repo.list_reviews({"product_id": random.choice(PRODUCTS)}, -1, 20)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(args):
+    seed(args.uri, args.docs)
+    coll = MongoClient(args.uri, maxPoolSize=args.pool)[BENCH_DB]["reviews"]
+    repo = ReviewRepository(uri=args.uri, db_name=BENCH_DB, max_pool_size=args.pool)
+    # warm both pools
+    await run_blocking(coll, 50, 1)
+    await run_repository(repo, 50, 1)
+    print(f"{'in-flight':>10} {'pymongo req/s':>15} {'repository req/s':>18}")
+    for concurrency in args.levels:
+        blocking = await run_blocking(coll, args.requests, concurrency)
+        async_rps = await run_repository(repo, args.requests, concurrency)
+        print(f"{concurrency:>10} {blocking:>15.0f} {async_rps:>18.0f}")
+    repo.close()
+    MongoClient(args.uri).drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--pool", type=int, default=100)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64, 128])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+"""Keyword search latency: unanchored $regex scan vs. the trigram index.
+
+Runs against a local mongod (no auth by default) in a throwaway database,
+once per collection size:
+
+    python benchmarks/bench_keyword_search.py --uri mongodb://localhost:27017/ --sizes 100000 1000000
+
+The "regex" column is the old /reviews/keyword query (case-insensitive
+$regex on headline and review, a full collection scan) with the same limit;
+the "trigram" column is ReviewRepository.keyword_search. Keywords range
+from rare to common, since a common keyword fills the limit early in a scan.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient, DESCENDING
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from repository import ReviewRepository  # noqa: E402
+
+BENCH_DB = "reviews_keyword_bench"
+WORDS = ("crisp malty bitter hoppy smooth roasty citrus piney dry sweet sour funky golden amber hazy "
+         "creamy toasty earthy floral grassy biscuit caramel coffee cocoa vanilla banana clove").split()
+# (keyword, how often it is planted)
+KEYWORDS = [("zwickelbier", 0.0001), ("gooseberry", 0.001), ("pumpernickel", 0.01), ("hoppy", None)]
+
+
+def text(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def seed(uri: str, count: int, batch: int = 10000):
+    rng = random.Random(count)
+    db = MongoClient(uri)[BENCH_DB]
+    db.reviews.drop()
+    db.review_trigrams.drop()
+    start = datetime.utcnow() - timedelta(days=365)
+    for offset in range(0, count, batch):
+        docs = []
+        for i in range(offset, min(offset + batch, count)):
+            review = text(rng, 30)
+            for keyword, rate in KEYWORDS:
+                if rate and rng.random() < rate:
+                    review += f" {keyword.capitalize()} notes"
+            docs.append({
+                "headline": text(rng, 4), "review": review, "rating": rng.randint(1, 5),
+                "product_id": f"beer-{i % 200}", "user_email": f"user{i % 1000}@example.com",
+                "created_at": start + timedelta(seconds=i), "updated_at": start + timedelta(seconds=i),
+            })
+        db.reviews.insert_many(docs)
+
+
+def regex_search(coll, keyword: str, limit: int):
+    return list(coll.find({"$or": [
+        {"headline": {"$regex": keyword, "$options": "i"}},
+        {"review": {"$regex": keyword, "$options": "i"}},
+    ]}).sort("_id", DESCENDING).limit(limit))
+
+
+async def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        if asyncio.iscoroutine(result):
+            result = await result
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), len(result)
+
+
+async def main(args):
+    for size in args.sizes:
+        seed(args.uri, size)
+        coll = MongoClient(args.uri)[BENCH_DB]["reviews"]
+        repo = ReviewRepository(uri=args.uri, db_name=BENCH_DB)
+        await repo.ensure_indexes()
+        start = time.perf_counter()
+        await repo.rebuild_trigrams()
+        print(f"\n{size} reviews (trigram index built in {time.perf_counter() - start:.1f} s)")
+        print(f"{'keyword':>14} {'hits':>5} {'regex ms':>10} {'trigram ms':>11}")
+        for keyword, _ in KEYWORDS:
+            regex_ms, hits = await timed(lambda: regex_search(coll, keyword, args.limit), args.repeat)
+            tri_ms, tri_hits = await timed(lambda: repo.keyword_search(keyword, args.limit), args.repeat)
+            assert hits == tri_hits, f"{keyword}: regex found {hits}, trigram found {tri_hits}"
+            print(f"{keyword:>14} {hits:>5} {regex_ms:>10.1f} {tri_ms:>11.1f}")
+        repo.close()
+    MongoClient(args.uri).drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
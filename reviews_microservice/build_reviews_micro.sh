@@ -5,6 +5,6 @@ PORT=${1:-8011}
 echo "Setting up reviews microservice:"
 echo "- Backend port: $PORT"
 
-sudo docker build --build-arg PORT=$PORT -t reviews-backend:$PORT ./backend
+sudo docker build --build-arg PORT=$PORT -t reviews-backend:$PORT -f backend/dockerfile ..
 
 echo "Setup complete! Run the service with: ./start.sh $PORT "
\ No newline at end of file
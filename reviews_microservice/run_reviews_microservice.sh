@@ -6,7 +6,7 @@ NETWORK_NAME="beer_review_network"
 MONGO_REPLICA_SET="rs0"  # Match the RS_NAME from setup_database.sh
 BACKEND_CONTAINER="reviews_backend_${PORT}"
 
-sudo docker build --build-arg PORT=$PORT -t reviews-backend:$PORT ./backend
+sudo docker build --build-arg PORT=$PORT -t reviews-backend:$PORT -f backend/dockerfile ..
 
 echo "Starting reviews microservice:"
 echo "- Backend port: $PORT"
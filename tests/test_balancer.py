@@ -0,0 +1,208 @@
+import time
+import random
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from common import balancer
+from common.balancer import Balancer
+
+ENDPOINTS = [("upstream", 9000 + i) for i in range(3)]
+
+
+def make_balancer(endpoints=ENDPOINTS) -> Balancer:
+    return Balancer("test-service", lambda: list(endpoints), "http://{host}:{port}",
+                    hedge=False, rng=random.Random(7))
+
+
+def fail(lb: Balancer, endpoint, times: int):
+    for _ in range(times):
+        lb.instances[endpoint].inflight += 1
+        lb.record(endpoint, 0.01, False)
+
+
+def expire_breaker(lb: Balancer, endpoint):
+    lb.instances[endpoint].open_until = time.monotonic() - 1
+
+
+def test_breaker_opens_after_consecutive_failures():
+    lb = make_balancer()
+    lb.pick()
+    bad = ENDPOINTS[0]
+    fail(lb, bad, balancer.LB_FAILURE_THRESHOLD - 1)
+    assert not lb.instances[bad].open_until
+    fail(lb, bad, 1)
+    assert lb.instances[bad].open_until > time.monotonic()
+    assert bad not in {lb.pick() for _ in range(50)}
+
+
+def test_half_open_allows_one_probe_at_a_time():
+    lb = make_balancer()
+    lb.pick()
+    bad = ENDPOINTS[0]
+    fail(lb, bad, balancer.LB_FAILURE_THRESHOLD)
+    expire_breaker(lb, bad)
+
+    picks = [lb.pick() for _ in range(50)]
+    assert picks.count(bad) == 1
+    assert lb.instances[bad].probing
+
+
+def test_successful_probe_closes_breaker():
+    lb = make_balancer()
+    lb.pick()
+    bad = ENDPOINTS[0]
+    fail(lb, bad, balancer.LB_FAILURE_THRESHOLD)
+    expire_breaker(lb, bad)
+    while lb.pick() != bad:
+        pass
+
+    lb.record(bad, 0.01, True)
+    instance = lb.instances[bad]
+    assert (instance.open_until, instance.probing, instance.failures) == (0.0, False, 0)
+
+
+def test_failed_probe_reopens_breaker():
+    lb = make_balancer()
+    lb.pick()
+    bad = ENDPOINTS[0]
+    fail(lb, bad, balancer.LB_FAILURE_THRESHOLD)
+    expire_breaker(lb, bad)
+    while lb.pick() != bad:
+        pass
+
+    lb.record(bad, 0.01, False)
+    instance = lb.instances[bad]
+    assert instance.open_until > time.monotonic()
+    assert not instance.probing
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    lb = make_balancer()
+    lb.pick()
+    bad = ENDPOINTS[0]
+    fail(lb, bad, balancer.LB_FAILURE_THRESHOLD)
+    expire_breaker(lb, bad)
+    while lb.pick() != bad:
+        pass
+
+    lb.record(bad, None, False)
+    assert lb.instances[bad].available(time.monotonic())
+
+
+def test_all_open_falls_back_to_every_instance():
+    lb = make_balancer()
+    lb.pick()
+    for endpoint in ENDPOINTS:
+        fail(lb, endpoint, balancer.LB_FAILURE_THRESHOLD)
+    assert lb.pick() in ENDPOINTS
+
+
+def test_base_url_does_not_claim_the_probe():
+    lb = make_balancer()
+    lb.pick()
+    bad = ENDPOINTS[0]
+    fail(lb, bad, balancer.LB_FAILURE_THRESHOLD)
+    expire_breaker(lb, bad)
+
+    urls = {lb.base_url() for _ in range(50)}
+    assert lb.url(bad) in urls
+    assert not lb.instances[bad].probing
+
+
+def test_tripped_instance_recovers_after_base_url_callers():
+    lb = make_balancer()
+    lb.pick()
+    bad = ENDPOINTS[0]
+    fail(lb, bad, balancer.LB_FAILURE_THRESHOLD)
+    expire_breaker(lb, bad)
+    for _ in range(20):
+        lb.base_url()
+
+    async def send():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+        async with client:
+            for _ in range(50):
+                await lb.get(client, "/ping")
+
+    asyncio.run(send())
+    instance = lb.instances[bad]
+    assert (instance.open_until, instance.probing, instance.failures) == (0.0, False, 0)
+
+
+def warm_up(lb: Balancer, slow, fast_rtt=0.01, slow_rtt=0.2):
+    # one round past the minimum, so every instance is judged against measured peers
+    for _ in range(balancer.LB_OUTLIER_MIN_SAMPLES + 1):
+        for endpoint in lb.instances:
+            lb.instances[endpoint].inflight += 1
+            lb.record(endpoint, slow_rtt if endpoint in slow else fast_rtt, True)
+
+
+def test_slow_outlier_is_ejected():
+    lb = make_balancer()
+    lb.pick()
+    slow = ENDPOINTS[0]
+    warm_up(lb, {slow})
+
+    instance = lb.instances[slow]
+    assert instance.ejected_until > time.monotonic()
+    # it comes back unmeasured
+    assert instance.ewma is None and instance.samples == 0
+    assert slow not in {lb.pick() for _ in range(50)}
+    assert not any(lb.instances[e].ejected_until for e in ENDPOINTS[1:])
+
+
+def test_ejection_is_capped_by_max_ejected():
+    endpoints = [("upstream", 9000 + i) for i in range(4)]
+    lb = make_balancer(endpoints)
+    lb.pick()
+    slow = set(endpoints[:3])
+    # fast peers first, so the median stays low while the slow ones are judged
+    warm_up(lb, slow, slow_rtt=0.01)
+    for _ in range(3):
+        for endpoint in slow:
+            lb.instances[endpoint].inflight += 1
+            lb.record(endpoint, 0.5, True)
+
+    now = time.monotonic()
+    ejected = [e for e in endpoints if lb.instances[e].ejected_until > now]
+    assert len(ejected) == balancer.LB_MAX_EJECTED * len(endpoints)
+
+
+def test_no_endpoints_is_503():
+    lb = make_balancer([])
+    with pytest.raises(HTTPException) as exc:
+        lb.pick()
+    assert exc.value.status_code == 503
+
+
+def test_hedged_away_replica_loses_its_share(monkeypatch):
+    monkeypatch.setattr(balancer, "LB_HEDGE_BUDGET", 1.0)
+    slow = ENDPOINTS[0]
+    lb = Balancer("test-service", lambda: list(ENDPOINTS), "http://{host}:{port}", hedge=True, rng=random.Random(7))
+    lb.pick()
+    for endpoint in ENDPOINTS[1:]:
+        for _ in range(5):
+            lb.instances[endpoint].inflight += 1
+            lb.record(endpoint, 0.001, True)
+    lb.latencies.extend([0.001] * 50)
+    hits = []
+
+    async def handler(request):
+        hits.append(request.url.port)
+        # the slow replica never answers in time; every attempt on it is hedged away
+        if request.url.port == slow[1]:
+            await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            for _ in range(60):
+                await lb.get(client, "/ping")
+
+    asyncio.run(send())
+    assert hits[:20].count(slow[1]) >= 1
+    assert hits[20:].count(slow[1]) <= 2
+    assert lb.instances[slow].ewma >= balancer.LB_HEDGE_MIN_DELAY
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+from common import events
+from common.events import EventPublisher
+
+
+class FlakyExchange:
+    """Records published events; the first publish of each body in `fail_once` is not confirmed"""
+    def __init__(self, fail_once=()):
+        self.fail_once = set(fail_once)
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        event = json.loads(message.body)
+        if event["n"] in self.fail_once:
+            self.fail_once.discard(event["n"])
+            raise RuntimeError("nack")
+        self.published.append(event["n"])
+
+
+def publish_until_done(publisher, exchange, batch):
+    async def run():
+        remaining = batch
+        while remaining:
+            remaining = await publisher._publish_batch(exchange, remaining)
+    asyncio.run(run())
+
+
+def test_batch_without_failures_is_done():
+    exchange = FlakyExchange()
+    publisher = EventPublisher(routing_key="likes")
+    batch = [{"n": i} for i in range(5)]
+    assert asyncio.run(publisher._publish_batch(exchange, batch)) == []
+    assert exchange.published == [0, 1, 2, 3, 4]
+
+
+def test_retry_starts_at_first_failure_and_keeps_order():
+    exchange = FlakyExchange(fail_once={1, 3})
+    publisher = EventPublisher(routing_key="likes")
+    batch = [{"n": i} for i in range(5)]
+    assert asyncio.run(publisher._publish_batch(exchange, batch)) == batch[1:]
+
+
+def test_last_delivery_of_each_event_follows_batch_order():
+    # a like (1) that failed must not land after the unlike (2) that followed it
+    exchange = FlakyExchange(fail_once={1})
+    publisher = EventPublisher(routing_key="likes")
+    publish_until_done(publisher, exchange, [{"n": i} for i in range(4)])
+
+    last_seen = {n: i for i, n in enumerate(exchange.published)}
+    assert sorted(last_seen, key=last_seen.get) == [0, 1, 2, 3]
+
+
+class FlakyConnection:
+    """Opening a channel fails `failures` times before it works"""
+    def __init__(self, exchange, failures: int):
+        self.exchange = exchange
+        self.failures = failures
+        self.opened = 0
+
+    async def channel(self, publisher_confirms=False):
+        self.opened += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("channel setup failed")
+        return FakeChannel(self.exchange)
+
+
+class FakeChannel:
+    def __init__(self, exchange):
+        self.default_exchange = exchange
+
+    async def close(self):
+        pass
+
+
+def test_flusher_retries_channel_setup(monkeypatch):
+    monkeypatch.setattr(events, "PUBLISH_RETRY_DELAY", 0.001)
+    exchange = FlakyExchange()
+    publisher = EventPublisher(routing_key="likes", channels=1, flush_interval=0.001)
+    publisher._connection = FlakyConnection(exchange, failures=3)
+
+    async def run():
+        for i in range(3):
+            publisher.publish_nowait({"n": i})
+        flusher = asyncio.create_task(publisher._flusher(publisher._buffers[0]))
+        for _ in range(200):
+            if len(exchange.published) == 3:
+                break
+            await asyncio.sleep(0.01)
+        # still running after the failed setups
+        assert not flusher.done()
+        flusher.cancel()
+
+    asyncio.run(run())
+    assert exchange.published == [0, 1, 2]
+    assert publisher._connection.opened == 4
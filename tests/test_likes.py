@@ -0,0 +1,76 @@
+import asyncio
+import random
+
+import httpx
+
+from common.balancer import Balancer
+from common.likes import LikesClient
+
+TOKEN = "Bearer token"
+
+
+def make_likes(endpoints, handler) -> LikesClient:
+    users = Balancer("beer_review_user_service", lambda: list(endpoints), "http://{host}:{port}",
+                     hedge=False, rng=random.Random(7))
+    likes = LikesClient(users)
+    likes._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return likes
+
+
+def contains(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={"user_id": 1, "liked": ["a"]})
+
+
+def test_liked_asks_the_user_service_once_then_caches():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return contains(request)
+
+    likes = make_likes([("users", 8001)], handler)
+    assert asyncio.run(likes.liked(TOKEN, ["a", "b"])) == {"a"}
+    assert asyncio.run(likes.liked(TOKEN, ["a", "b"])) == {"a"}
+    assert len(calls) == 1
+
+
+def test_no_user_service_instance_is_a_degraded_lookup():
+    likes = make_likes([], contains)
+    assert asyncio.run(likes.liked(TOKEN, ["a", "b"])) == set()
+
+
+def test_user_service_error_is_a_degraded_lookup():
+    likes = make_likes([("users", 8001)], lambda request: httpx.Response(500))
+    assert asyncio.run(likes.liked(TOKEN, ["a", "b"])) == set()
+
+
+
+def stale(request: httpx.Request) -> httpx.Response:
+    # the user service has not committed the like yet
+    return httpx.Response(200, json={"user_id": 1, "liked": []})
+
+
+def test_like_without_cache_entry_reads_back_liked():
+    likes = make_likes([("users", 8001)], stale)
+    likes.cache.apply([{"user_id": 1, "post_id": "a", "liked": True}])
+    assert asyncio.run(likes.liked(TOKEN, ["a", "b"])) == {"a"}
+    assert asyncio.run(likes.liked(TOKEN, ["a", "b"])) == {"a"}
+
+
+def test_like_during_cold_lookup_wins_over_its_answer():
+    async def run():
+        asked, answer = asyncio.Event(), asyncio.Event()
+
+        async def handler(request):
+            asked.set()
+            await answer.wait()
+            return stale(request)
+
+        likes = make_likes([("users", 8001)], handler)
+        lookup = asyncio.create_task(likes.liked(TOKEN, ["a", "b"]))
+        await asked.wait()
+        likes.cache.apply([{"user_id": 1, "post_id": "a", "liked": True}])
+        answer.set()
+        return await lookup, await likes.liked(TOKEN, ["a", "b"])
+
+    assert asyncio.run(run()) == ({"a"}, {"a"})
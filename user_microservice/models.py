@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel, EmailStr, Field
 
 class UserRegister(BaseModel):
@@ -15,4 +16,7 @@ class UserInDB(BaseModel):
     nickname: str
     
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class PostIds(BaseModel):
+    post_ids: List[str]
@@ -17,7 +17,8 @@ CONTAINER_NAME="beer_review_user_service_${USER_SERVICE_PORT}"
 
 # Build the image
 echo "Building user microservice image"
-sudo docker build -t beer_review_user_service ../user_microservice
+# the repo root is the build context, so the image can copy common/
+sudo docker build -t beer_review_user_service -f ../user_microservice/dockerfile ..
 
 # Check if container exists
 if sudo docker ps -a --format '{{.Names}}' | grep -q "^${CONTAINER_NAME}$"; then
@@ -12,5 +12,6 @@ cd $(dirname "$0")
 # Ensure Python dependencies are installed
 pip install --no-cache-dir -r requirements.txt
 
-# Run the consumer
+# Run the consumer, with the shared modules in common/ importable
+export PYTHONPATH="$(cd .. && pwd)${PYTHONPATH:+:$PYTHONPATH}"
 python3 consume_likes.py